@@ -4,8 +4,15 @@
 
 
 #Importar camadas em branch para o PostgreSQL
+import sqlite3
+import struct
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime
+from urllib.request import pathname2url
+
 import processing
-from qgis.core import QgsMessageLog, Qgis, QgsVectorLayer
+from qgis.core import QgsMessageLog, Qgis, QgsFeatureRequest, QgsProviderRegistry, QgsVectorLayer, QgsVectorLayerFeatureSource, QgsWkbTypes
+from qgis.PyQt.QtCore import QVariant
 
 # ======================================================================
 # --- MODO DE EXECUÇÃO ---
@@ -19,17 +26,258 @@ database_name = "Planejamento"
 schema_name = "geohab"
 geometry_column = "geom"
 table_prefix = "dpdu_usmb"
+UPLOAD_WORKERS = 4 # uploads simultâneos para o PostGIS (conexões no pool)
+
+# Tabela de transliteração do nome da camada (aplicada em uma única passada com str.translate)
+_TRANSLIT = str.maketrans({
+    ' ': '_', '-': '_', '´': '_', '(': '', ')': '', '.': '', "'": '', ',': '', ';': '',
+    'Á': 'A', 'á': 'a', 'ã': 'a', 'ç': 'c', 'é': 'e', 'í': 'i', 'ó': 'o', 'õ': 'o', 'ú': 'u', 'Ú': 'U',
+})
 
 # --- FUNÇÕES AUXILIARES ---
 def list_gpkg_layers(path):
+    # Leitura direta da gpkg_contents: evita abrir o GPKG pelo provedor OGR,
+    # que varre campos e restrições de todas as camadas só para listar nomes.
+    # Sem filtro de data_type (entram também as tabelas de atributos) e na ordem
+    # do rowid, como no antigo subLayers(), mantendo a numeração das camadas.
+    try:
+        con = sqlite3.connect(f"file:{pathname2url(path)}?mode=ro", uri=True)
+        try:
+            return [row[0] for row in con.execute(
+                "SELECT table_name FROM gpkg_contents ORDER BY rowid"
+            )]
+        finally:
+            con.close()
+    except sqlite3.Error as e:
+        QgsMessageLog.logMessage(f"gpkg_contents ilegível ({e}), listando pelo provedor OGR.", 'Importação Lote', level=Qgis.Warning)
+
+    # Varredura completa (sem FastScan): num GPKG o FastScan não abre o arquivo e devolve
+    # só um item com o nome do arquivo, não uma entrada por tabela.
     try:
-        gpkg_layer_object = QgsVectorLayer(path, "temp_layer_for_listing", "ogr")
-        provider = gpkg_layer_object.dataProvider()
-        return [item.split('!!::!!')[1] for item in provider.subLayers()]
+        metadata = QgsProviderRegistry.instance().providerMetadata('ogr')
+        return [s.name() for s in metadata.querySublayers(path)]
     except Exception as e:
         QgsMessageLog.logMessage(f"Erro ao listar camadas: {e}", 'Importação Lote', level=Qgis.Critical)
         return []
 
+def has_invalid_geometries(layer):
+    """Retorna True na primeira geometria inválida (GEOS) encontrada na camada."""
+    request = QgsFeatureRequest().setNoAttributes()
+    for feature in layer.getFeatures(request):
+        geometry = feature.geometry()
+        if not geometry.isNull() and not geometry.isGeosValid():
+            return True
+    return False
+
+def get_pg_credentials(connection_name):
+    """Lê host, porta, banco, usuário e senha da conexão salva no QGIS."""
+    from qgis.PyQt.QtCore import QSettings
+    from qgis.core import QgsAuthMethodConfig, QgsApplication
+
+    s = QSettings()
+    base = f"PostgreSQL/connections/{connection_name}"
+    db = s.value(f"{base}/database", None)
+    if not db:
+        QgsMessageLog.logMessage(f"Conexão '{connection_name}' não encontrada no QGIS.", 'Importação Lote', level=Qgis.Critical)
+        return None
+
+    user = s.value(f"{base}/username", "")
+    password = s.value(f"{base}/password", "")
+    authcfg = s.value(f"{base}/authcfg", "")
+    if authcfg and (not user or not password):
+        cfg = QgsAuthMethodConfig()
+        QgsApplication.authManager().loadAuthenticationConfig(authcfg, cfg, True)
+        user = cfg.config("username", user)
+        password = cfg.config("password", password)
+
+    return {
+        "host": s.value(f"{base}/host", "localhost"),
+        "port": s.value(f"{base}/port", "5432"),
+        "database": db,
+        "user": user,
+        "password": password,
+    }
+
+def pg_pool(creds, max_connections):
+    from psycopg2.pool import ThreadedConnectionPool
+    return ThreadedConnectionPool(
+        1,
+        max_connections,
+        host=creds["host"],
+        port=creds["port"],
+        dbname=creds["database"],
+        user=creds["user"],
+        password=creds["password"],
+    )
+
+# --- COPY BINÁRIO PARA O POSTGIS ---
+# Tipo PostgreSQL e codificador binário (formato do COPY ... FORMAT BINARY) por tipo de campo
+_PG_EPOCH_DATE = date(2000, 1, 1)
+_PG_EPOCH_DATETIME = datetime(2000, 1, 1)
+
+def _encode_int4(v): return struct.pack('>i', int(v))
+def _encode_int8(v): return struct.pack('>q', int(v))
+def _encode_float8(v): return struct.pack('>d', float(v))
+def _encode_bool(v): return b'\x01' if v else b'\x00'
+def _encode_text(v): return str(v).encode('utf-8')
+def _encode_date(v):
+    v = v.toPyDate() if hasattr(v, 'toPyDate') else v
+    return struct.pack('>i', (v - _PG_EPOCH_DATE).days)
+def _encode_timestamp(v):
+    v = v.toPyDateTime() if hasattr(v, 'toPyDateTime') else v
+    delta = v.replace(tzinfo=None) - _PG_EPOCH_DATETIME
+    return struct.pack('>q', (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+def _encode_time(v):
+    v = v.toPyTime() if hasattr(v, 'toPyTime') else v
+    return struct.pack('>q', ((v.hour * 60 + v.minute) * 60 + v.second) * 1000000 + v.microsecond)
+
+PG_TYPES = {
+    QVariant.Int:       ('integer',          _encode_int4),
+    QVariant.UInt:      ('bigint',           _encode_int8),
+    QVariant.LongLong:  ('bigint',           _encode_int8),
+    QVariant.ULongLong: ('bigint',           _encode_int8),
+    QVariant.Double:    ('double precision', _encode_float8),
+    QVariant.Bool:      ('boolean',          _encode_bool),
+    QVariant.Date:      ('date',             _encode_date),
+    QVariant.DateTime:  ('timestamp',        _encode_timestamp),
+    QVariant.Time:      ('time',             _encode_time),
+}
+PG_TYPE_DEFAULT = ('text', _encode_text)
+
+def quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+def to_ewkb(wkb, srid):
+    """Converte WKB em EWKB inserindo o SRID logo após o tipo da geometria."""
+    order = '<' if wkb[0] == 1 else '>'
+    wkb_type = struct.unpack(order + 'I', wkb[1:5])[0]
+    return wkb[:1] + struct.pack(order + 'II', wkb_type | 0x20000000, srid) + wkb[5:]
+
+def pg_geometry_type(wkb_type):
+    """Tipo da coluna no PostGIS: Unknown/NoGeometry viram Geometry e 2.5D usa a grafia Z (ex.: MultiPolygonZ)."""
+    flat = QgsWkbTypes.flatType(wkb_type)
+    if flat in (QgsWkbTypes.Unknown, QgsWkbTypes.NoGeometry):
+        return 'Geometry'
+    return QgsWkbTypes.displayString(QgsWkbTypes.zmType(flat, QgsWkbTypes.hasZ(wkb_type), QgsWkbTypes.hasM(wkb_type)))
+
+class CopyStream:
+    """
+    Fluxo binário do COPY gerado sob demanda (objeto tipo arquivo lido pelo copy_expert):
+    cada tupla é montada quando o PostgreSQL pede mais dados, sem carregar a camada inteira
+    na memória. Lê de um QgsVectorLayerFeatureSource, criado na thread principal e seguro
+    para iterar na thread de upload. with_geom=False para tabelas sem geometria.
+    """
+    def __init__(self, source, encoders, srid, with_geom=True):
+        self._chunks = self._rows(source, encoders, srid, with_geom)
+        self._pending = bytearray()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._pending += chunk
+        if size < 0:
+            size = len(self._pending)
+        data = bytes(self._pending[:size])
+        del self._pending[:size]
+        return data
+
+    def _rows(self, source, encoders, srid, with_geom):
+        yield b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+        row_header = struct.pack('>h', len(encoders) + (1 if with_geom else 0))
+        null = struct.pack('>i', -1)
+        for feature in source.getFeatures():
+            row = bytearray(row_header)
+            for value, encode in zip(feature.attributes(), encoders):
+                if value is None or (isinstance(value, QVariant) and value.isNull()):
+                    row += null
+                else:
+                    data = encode(value)
+                    row += struct.pack('>i', len(data))
+                    row += data
+            if with_geom:
+                geometry = feature.geometry()
+                if geometry is None or geometry.isNull():
+                    row += null
+                else:
+                    data = to_ewkb(bytes(geometry.asWkb()), srid)
+                    row += struct.pack('>i', len(data))
+                    row += data
+            yield bytes(row)
+        yield struct.pack('>h', -1)
+
+def prepare_import(layer, tablename):
+    """
+    Lê a estrutura da camada (na thread principal, onde os objetos do QGIS podem ser usados)
+    e devolve o que o upload precisa: comandos SQL e o fluxo do COPY, que lê as feições
+    sob demanda na thread de upload.
+    """
+    fields = layer.fields()
+    columns = [field.name().lower() for field in fields]
+    types = [PG_TYPES.get(field.type(), PG_TYPE_DEFAULT) for field in fields]
+    srid = layer.crs().postgisSrid()
+    geom_type = pg_geometry_type(layer.wkbType())
+    target = f"{quote_ident(schema_name)}.{quote_ident(tablename)}"
+
+    with_geom = layer.wkbType() != QgsWkbTypes.NoGeometry   # tabelas de atributos vêm sem geometria
+
+    column_ddl = [f"{quote_ident(col)} {pg_type}" for col, (pg_type, _) in zip(columns, types)]
+    if 'id' not in columns:
+        column_ddl.insert(0, "id serial PRIMARY KEY")
+    if with_geom:
+        column_ddl.append(f"{quote_ident(geometry_column)} geometry({geom_type}, {srid})")
+    copy_columns = ", ".join(quote_ident(col) for col in columns + ([geometry_column] if with_geom else []))
+
+    return {
+        'target': target,
+        'ddl': [f"DROP TABLE IF EXISTS {target}", f"CREATE TABLE {target} ({', '.join(column_ddl)})"],
+        'copy_sql': f"COPY {target} ({copy_columns}) FROM STDIN WITH (FORMAT BINARY)",
+        'stream': CopyStream(QgsVectorLayerFeatureSource(layer), [encode for _, encode in types], srid, with_geom),
+        'spatial': with_geom,
+    }
+
+def upload_import(pool, job):
+    """
+    Executa a carga em uma conexão do pool (roda nas threads de upload).
+    Tabela, COPY, índice espacial e ANALYZE ficam em uma única transação.
+    """
+    conn = pool.getconn()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                for statement in job['ddl']:
+                    cur.execute(statement)
+                cur.copy_expert(job['copy_sql'], job['stream'])
+                # Índice espacial e estatísticas só depois da carga completa
+                if job['spatial']:
+                    cur.execute(f"CREATE INDEX ON {job['target']} USING GIST ({quote_ident(geometry_column)})")
+                cur.execute(f"ANALYZE {job['target']}")
+    finally:
+        pool.putconn(conn)
+
+def report_success(layer_name, tablename):
+    success_message = f"Camada '{layer_name}' corrigida e importada com sucesso para '{tablename}'"
+    print(f"    ✅ SUCESSO: {success_message}\n")
+    QgsMessageLog.logMessage(success_message, 'Importação Lote', level=Qgis.Success)
+
+def report_failure(layer_name, e):
+    error_message = f"Falha CRÍTICA no processo da camada '{layer_name}'. Erro: {e}"
+    print(f"    ❌ ERRO: {error_message}\n")
+    QgsMessageLog.logMessage(error_message, 'Importação Lote', level=Qgis.Critical)
+
+def collect_uploads(pending, wait_all=False):
+    """Reporta os uploads concluídos e devolve os que ainda estão em andamento."""
+    done, not_done = wait(pending, return_when=ALL_COMPLETED if wait_all else FIRST_COMPLETED)
+    for future in done:
+        layer_name, tablename = pending[future]
+        try:
+            future.result()
+            report_success(layer_name, tablename)
+        except Exception as e:
+            report_failure(layer_name, e)
+    return {future: pending[future] for future in not_done}
+
 # --- SCRIPT PRINCIPAL ---
 
 print("Iniciando processo com ESTRATÉGIA DE CORREÇÃO DE GEOMETRIAS.")
@@ -37,10 +285,25 @@ if MODO_DE_RETENTATIVA:
     print(f"MODO DE RETENTATIVA ATIVADO. Processando apenas as camadas: {NUMEROS_DAS_CAMADAS_PARA_REIMPORTAR}")
 print("-" * 50)
 
-all_layers = list_gpkg_layers(gpkg_path)
-if not all_layers:
+creds = get_pg_credentials(database_name)
+all_layers = list_gpkg_layers(gpkg_path) if creds else []
+if not creds:
+    print(f"FINALIZADO: Conexão PostgreSQL '{database_name}' não encontrada no QGIS.")
+elif not all_layers:
     print("FINALIZADO: Nenhuma camada encontrada.")
 else:
+    # Correção das camadas segue na thread principal (PyQGIS/processing não são thread-safe);
+    # o upload (COPY + índice + ANALYZE) roda em paralelo em UPLOAD_WORKERS threads, cada uma
+    # com sua conexão do pool, lendo as feições sob demanda pela fonte de feições do job.
+    # Cada camada faz o próprio commit (ou rollback).
+    try:
+        pool = pg_pool(creds, UPLOAD_WORKERS)
+    except Exception as e:
+        QgsMessageLog.logMessage(f"Falha ao conectar ao PostgreSQL '{database_name}': {e}", 'Importação Lote', level=Qgis.Critical)
+        raise
+    executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+    pending = {}
+
     for i, layer_name in enumerate(all_layers, start=1):
         if MODO_DE_RETENTATIVA and i not in NUMEROS_DAS_CAMADAS_PARA_REIMPORTAR:
             continue
@@ -48,52 +311,54 @@ else:
         print(f"--> Processando camada {i}: '{layer_name}'")
 
         try:
-            # --- PASSO 1: CORRIGIR AS GEOMETRIAS ---
-            print("    1. Corrigindo geometrias...")
-            
-            # Parâmetros para a ferramenta "Corrigir geometrias"
-            fix_params = {
-                'INPUT': f"{gpkg_path}|layername={layer_name}",
-                'OUTPUT': 'memory:' # Salva a camada corrigida na memória
-            }
-            
-            # Executa a correção e pega o resultado
-            result = processing.run("native:fixgeometries", fix_params)
-            fixed_layer = result['OUTPUT']
-            
-            print("    -> Geometrias corrigidas com sucesso.")
+            # --- PASSO 1: CORRIGIR AS GEOMETRIAS (só se houver alguma inválida) ---
+            layer_uri = f"{gpkg_path}|layername={layer_name}"
+            source_layer = QgsVectorLayer(layer_uri, layer_name, "ogr")
+            if not source_layer.isValid():
+                raise RuntimeError(f"camada inválida no GPKG: {layer_uri}")
+
+            if has_invalid_geometries(source_layer):
+                print("    1. Corrigindo geometrias...")
+                
+                # Parâmetros para a ferramenta "Corrigir geometrias"
+                fix_params = {
+                    'INPUT': layer_uri,
+                    'OUTPUT': 'memory:' # Salva a camada corrigida na memória
+                }
+                
+                # Executa a correção e pega o resultado
+                result = processing.run("native:fixgeometries", fix_params)
+                fixed_layer = result['OUTPUT']
+                
+                print("    -> Geometrias corrigidas com sucesso.")
+            else:
+                # Todas válidas: importa direto do GPKG, sem cópia em memória
+                print("    1. Geometrias já válidas, correção dispensada.")
+                fixed_layer = source_layer
 
             # --- PASSO 2: IMPORTAR A CAMADA JÁ CORRIGIDA ---
             print("    2. Importando camada corrigida para o PostGIS...")
             
             #clean_layer_name = layer_name.replace(' ', '_').replace('-', '_').replace('(', '').replace(')', '').replace(',', '').lower()
-            clean_layer_name = layer.name().replace(' ', '_').replace('-', '_').replace('´', '_').replace('Á', 'A').replace('(', '').replace(')', '').replace('.', '').replace('ç', 'c').replace('ã', 'a').replace("'", '').replace(",", '').replace("á", 'a').replace("ó", 'o').replace("õ", 'o').replace("í", 'i').replace(";", '').replace("ú", 'u').replace("é", 'e').replace("Ú", 'U').lower()
+            clean_layer_name = layer_name.translate(_TRANSLIT).lower()
             base_tablename = f"{table_prefix}_{str(i).zfill(2)}_{clean_layer_name}"
             tablename = base_tablename[:63]
             print(f"       Tabela de destino: '{schema_name}.{tablename}'")
 
-            import_params = {
-                'INPUT': fixed_layer,  # << A ENTRADA AGORA É A CAMADA CORRIGIDA
-                'DATABASE': database_name,
-                'SCHEMA': schema_name,
-                'TABLENAME': tablename,
-                'GEOMETRY_COLUMN': geometry_column,
-                'ENCODING': 'UTF-8',
-                'OVERWRITE': True,
-                'CREATEINDEX': True,
-                'LOWERCASE_NAMES': True
-            }
-            
-            processing.run("native:importintopostgis", import_params)
-            
-            success_message = f"Camada '{layer_name}' corrigida e importada com sucesso para '{tablename}'"
-            print(f"    ✅ SUCESSO: {success_message}\n")
-            QgsMessageLog.logMessage(success_message, 'Importação Lote', level=Qgis.Success)
+            # COPY binário direto (substitui o native:importintopostgis, que insere linha a linha)
+            job = prepare_import(fixed_layer, tablename)  # << A ENTRADA AGORA É A CAMADA CORRIGIDA
+
+            # Limita os uploads em andamento (cada um com uma fonte de feições aberta)
+            if len(pending) >= UPLOAD_WORKERS:
+                pending = collect_uploads(pending)
+            pending[executor.submit(upload_import, pool, job)] = (layer_name, tablename)
 
         except Exception as e:
-            error_message = f"Falha CRÍTICA no processo da camada '{layer_name}'. Erro: {e}"
-            print(f"    ❌ ERRO: {error_message}\n")
-            QgsMessageLog.logMessage(error_message, 'Importação Lote', level=Qgis.Critical)
+            report_failure(layer_name, e)
 
+    if pending:
+        collect_uploads(pending, wait_all=True)
+    executor.shutdown()
+    pool.closeall()
     print("=" * 50)
     print("Processo concluído.")
\ No newline at end of file
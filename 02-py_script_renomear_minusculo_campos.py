@@ -1,123 +1,109 @@
 ####02
 # ======================================================================
-# SCRIPT PARA RENOMEAR CAMPOS (VERSÃO 8 - A ESTRATÉGIA FINAL E GARANTIDA)
+# SCRIPT PARA RENOMEAR CAMPOS (VERSÃO 9 - PLANO ÚNICO DE RENOMEAÇÃO)
 #
 # Funcionalidade:
-# - Baseado na solução mais pragmática e segura.
-# - FASE 1: Roda o script que funciona, renomeando campos para minúsculas e
-#           adicionando um sufixo numérico (ex: '_1') para resolver conflitos
-#           de forma segura e sem erros. A camada é SALVA.
-# - FASE 2: Roda uma rotina de limpeza que abre a camada já salva, encontra
-#           todos os campos com sufixo numérico e os renomeia, removendo
-#           o sufixo. A camada é SALVA novamente com os nomes finais corretos.
+# - Calcula, em uma única passada, o nome final (minúsculo) de cada campo.
+# - Conflitos reais (dois campos que só diferem na capitalização) recebem
+#   um sufixo numérico (ex: '_1'), como antes.
+# - Campos cujo nome atual bloqueia o nome final de algum campo (ex:
+#   'Nome' -> 'nome') passam antes por um nome temporário, em vez de
+#   persistir sufixos que depois precisariam ser removidos.
+# - Todas as renomeações vão ao provedor em lote; a camada não é relida
+#   entre as etapas.
 # ======================================================================
 
-from qgis.core import QgsProject, QgsVectorLayer, QgsVectorDataProvider, edit
+from qgis.core import QgsProject, QgsVectorLayer, QgsVectorDataProvider
 
-def phase_one_rename_with_suffix(layer):
-    """FASE 1: Renomeia para minúsculas e usa sufixo para evitar erros."""
-    print("    --- FASE 1: Renomeando e resolvendo conflitos iniciais com sufixo ---")
-    try:
-        with edit(layer):
-            fields = layer.fields()
-            # Este conjunto precisa incluir os nomes que já existem e os que serão criados
-            final_names_in_transaction = {f.name().lower() for f in fields}
-            
-            rename_map = {}
-            for i in range(len(fields)):
-                old_name = fields.field(i).name()
-                new_name = old_name.lower()
+def build_rename_plan(names):
+    """
+    Monta o plano de renomeação para minúsculas a partir dos nomes atuais (na ordem dos índices).
+    Retorna (etapa_temporaria, etapa_final), ambos no formato {índice: novo_nome}.
+    """
+    # Nomes que não mudam já estão ocupados (comparação sem diferenciar maiúsculas)
+    taken = {n.lower() for n in names if n == n.lower()}
 
-                if old_name == new_name:
-                    continue
-                
-                # Resolução de duplicatas que comprovadamente funciona
-                temp_new_name = new_name
-                count = 1
-                while temp_new_name in final_names_in_transaction:
-                    temp_new_name = f"{new_name}_{count}"
-                    count += 1
-                
-                new_name = temp_new_name
-                final_names_in_transaction.add(new_name)
-                rename_map[i] = new_name
-            
-            if not rename_map:
-                print("      Nenhum campo precisou ser renomeado na Fase 1.")
-                return True
+    final_step = {}
+    for i, old_name in enumerate(names):
+        new_name = old_name.lower()
+        if old_name == new_name:
+            continue
+        candidate = new_name
+        count = 1
+        while candidate in taken:
+            candidate = f"{new_name}_{count}"
+            count += 1
+        taken.add(candidate)
+        final_step[i] = candidate
 
-            for index, new_name in rename_map.items():
-                old_name = layer.fields().field(index).name()
-                layer.renameAttribute(index, new_name)
-                print(f"      '{old_name}' -> '{new_name}'")
-        
-        print("      FASE 1 concluída e salva.")
-        return True # Indica sucesso
+    # Campos cujo nome atual coincide com algum nome final saem do caminho antes
+    final_names = set(final_step.values())
+    used = {n.lower() for n in names} | taken
+    temp_step = {}
+    for i in final_step:
+        if names[i].lower() in final_names:
+            temp_name = f"{final_step[i]}__tmp"
+            while temp_name.lower() in used:
+                temp_name += "_"
+            used.add(temp_name.lower())
+            temp_step[i] = temp_name
 
-    except Exception as e:
-        print(f"❌ ERRO na FASE 1: {e}. O processo para esta camada foi interrompido.")
-        return False # Indica falha
+    return temp_step, final_step
 
-def phase_two_cleanup_suffix(layer):
-    """FASE 2: Remove os sufixos numéricos criados na Fase 1."""
-    print("    --- FASE 2: Removendo sufixos numéricos de limpeza ---")
+def rename_fields_lowercase(layer):
+    """Renomeia todos os campos da camada para minúsculas usando o plano único."""
     try:
-        fields_to_fix = {}
-        for field in layer.fields():
-            name = field.name()
-            if '_' in name:
-                parts = name.rsplit('_', 1)
-                if len(parts) == 2 and parts[1].isdigit():
-                    fields_to_fix[name] = parts[0] # Mapeia 'nome_1' -> 'nome'
-        
-        if not fields_to_fix:
-            print("      Nenhum sufixo para remover.")
+        # Nomes lidos uma única vez; o resto do processo não volta a consultar layer.fields()
+        names = [f.name() for f in layer.fields()]
+        temp_step, final_step = build_rename_plan(names)
+
+        if not final_step:
+            print("      Nenhum campo precisou ser renomeado.")
             return True
 
-        with edit(layer):
-            for temp_name, final_name in fields_to_fix.items():
-                idx = layer.fields().indexOf(temp_name)
-                if idx != -1:
-                    layer.renameAttribute(idx, final_name)
-                    print(f"      Limpeza: '{temp_name}' -> '{final_name}'")
-        
-        print("      FASE 2 concluída e salva.")
+        provider = layer.dataProvider()
+        for step in (temp_step, final_step):
+            if step and not provider.renameAttributes(step):
+                raise RuntimeError("o provedor recusou a renomeação dos campos")
+        layer.updateFields()
+
+        for index, new_name in final_step.items():
+            print(f"      '{names[index]}' -> '{new_name}'")
         return True
 
     except Exception as e:
-        print(f"❌ ERRO na FASE 2 (Limpeza): {e}.")
+        print(f"❌ ERRO ao renomear campos: {e}. O processo para esta camada foi interrompido.")
         return False
 
 # --- SCRIPT PRINCIPAL ---
 print("="*50)
-print("INICIANDO SCRIPT DE RENOMEAÇÃO (ESTRATÉGIA DE SUFIXO E LIMPEZA)")
+print("INICIANDO SCRIPT DE RENOMEAÇÃO (PLANO ÚNICO)")
 print("!!! FAÇA UM BACKUP DOS SEUS DADOS ANTES DE EXECUTAR !!!")
 print("="*50 + "\n")
 
 project = QgsProject.instance()
-layers_to_process = list(project.mapLayers().values())
+vector_layers = [
+    layer for layer in project.mapLayers().values()
+    if isinstance(layer, QgsVectorLayer) and layer.isValid()
+]
+
+# Filtra uma única vez as camadas cujo provedor permite renomear campos
+layers_to_process = []
+for layer in vector_layers:
+    if layer.dataProvider().capabilities() & QgsVectorDataProvider.RenameAttributes:
+        layers_to_process.append(layer)
+    else:
+        print(f"⚠️ AVISO: A camada '{layer.name()}' não suporta renomear campos. Camada ignorada.\n")
 
 if not layers_to_process:
-    print("Nenhuma camada encontrada no projeto.")
+    print("Nenhuma camada que permita renomear campos foi encontrada no projeto.")
 else:
     for layer in layers_to_process:
-        if isinstance(layer, QgsVectorLayer) and layer.isValid():
-            provider = layer.dataProvider()
-            if not (provider.capabilities() & QgsVectorDataProvider.RenameAttributes):
-                print(f"⚠️ AVISO: A camada '{layer.name()}' não suporta renomear campos. Camada ignorada.\n") color: #000000
-            
-                continue
-
-            print(f"🔄 Processando camada: '{layer.name()}'...")
-            
-            # Executa a Fase 1
-            success_phase1 = phase_one_rename_with_suffix(layer)
-            
-            # Só executa a Fase 2 se a Fase 1 foi bem-sucedida
-            if success_phase1:
-                phase_two_cleanup_suffix(layer)
-            
-            print(f"✅ Processo para a camada '{layer.name()}' finalizado.\n")
+        print(f"🔄 Processando camada: '{layer.name()}'...")
+        
+        rename_fields_lowercase(layer)
+        
+        print(f"✅ Processo para a camada '{layer.name()}' finalizado.\n")
 
 print("="*50)
 print("Processo concluído.")
\ No newline at end of file
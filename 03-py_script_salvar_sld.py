@@ -13,8 +13,17 @@
 # ======================================================================
 
 import os
+import re
+import tempfile
 from qgis.core import QgsProject, QgsMapLayer
 
+try:
+    from lxml import etree
+except ImportError:  # sem lxml, cai na substituição textual
+    etree = None
+
+OGC_PROPERTY_NAME = '{http://www.opengis.net/ogc}PropertyName'
+
 # ======================================================================
 # --- CONFIGURAÇÕES (Ajuste aqui conforme a necessidade) ---
 # ======================================================================
@@ -30,6 +39,12 @@ naming_style = 'PREFIXED'
 # 3. (Opcional) Defina o prefixo se usar o modo 'PREFIXED'.
 prefix = "DPDU_USMB"
 
+# Tabela de transliteração do nome da camada (aplicada em uma única passada com str.translate)
+_TRANSLIT = str.maketrans({
+    ' ': '_', '-': '_', '´': '_', '(': '', ')': '', '.': '', "'": '', ',': '', ';': '',
+    'Á': 'A', 'á': 'a', 'ã': 'a', 'ç': 'c', 'é': 'e', 'í': 'i', 'ó': 'o', 'õ': 'o', 'ú': 'u', 'Ú': 'U',
+})
+
 # ======================================================================
 # --- FUNÇÃO AUXILIAR PARA CORREÇÃO DOS CAMPOS ---
 # (Esta é a nova função que resolve o seu problema)
@@ -45,30 +60,56 @@ def corrigir_nomes_campos_no_sld(sld_filepath, layer):
         # Usamos um dicionário para mapear MAIÚSCULO -> correto
         field_map = {field.name().upper(): field.name() for field in layer.fields()}
         
+        field_map = {upper: correct for upper, correct in field_map.items() if upper != correct}
+        if not field_map:
+            return
+
         # 2. Ler o conteúdo do arquivo SLD gerado
-        with open(sld_filepath, 'r', encoding='utf-8') as f:
+        with open(sld_filepath, 'rb') as f:
             sld_content = f.read()
 
-        # Flag para saber se fizemos alguma alteração
         modificado = False
-        
-        # 3. Substituir cada nome de campo maiúsculo pelo nome correto
-        for uppercase_name, correct_name in field_map.items():
-            # Apenas substitui se o nome maiúsculo for diferente do correto
-            if uppercase_name != correct_name and uppercase_name in sld_content:
-                # Usamos <ogc:PropertyName> para ser mais específico e evitar substituições erradas
-                tag_upper = f"<ogc:PropertyName>{uppercase_name}</ogc:PropertyName>"
-                tag_correct = f"<ogc:PropertyName>{correct_name}</ogc:PropertyName>"
-                
-                # Substituímos no conteúdo
-                if tag_upper in sld_content:
-                    sld_content = sld_content.replace(tag_upper, tag_correct)
+        if etree is not None:
+            # 3. Percorrer os <ogc:PropertyName> do XML (uma única leitura com lxml)
+            #    e trocar só o texto desses elementos, sem tocar no resto do arquivo
+            root = etree.fromstring(sld_content)
+            for element in root.iter(OGC_PROPERTY_NAME):
+                name = (element.text or '').strip()
+                if name in field_map:
+                    element.text = field_map[name]
                     modificado = True
+            if modificado:
+                sld_content = etree.tostring(root.getroottree(), xml_declaration=True, encoding='UTF-8')
+        else:
+            # 3. Sem lxml: substituição textual em uma única passada (regex com alternância)
+            substituicoes = {
+                f"<ogc:PropertyName>{upper}</ogc:PropertyName>".encode('utf-8'):
+                    f"<ogc:PropertyName>{correct}</ogc:PropertyName>".encode('utf-8')
+                for upper, correct in field_map.items()
+            }
+            padrao = re.compile(b'|'.join(map(re.escape, sorted(substituicoes, key=len, reverse=True))))
+            sld_content, total = padrao.subn(lambda m: substituicoes[m.group(0)], sld_content)
+            modificado = total > 0
 
         # 4. Se o conteúdo foi modificado, salva o arquivo de volta
+        #    (grava em um arquivo temporário ao lado e troca de uma vez com os.replace:
+        #    o OneDrive sincroniza o arquivo uma única vez e nunca vê escrita parcial)
         if modificado:
-            with open(sld_filepath, 'w', encoding='utf-8') as f:
-                f.write(sld_content)
+            tmp_path = None
+            try:
+                with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(sld_filepath),
+                                                 suffix='.sld.tmp', delete=False) as tf:
+                    tmp_path = tf.name
+                    tf.write(sld_content)
+                os.replace(tmp_path, sld_filepath)
+            except Exception:
+                # Não deixa o .sld.tmp para trás na pasta sincronizada
+                if tmp_path:
+                    try:
+                        os.unlink(tmp_path)
+                    except OSError:
+                        pass
+                raise
             print(f"    -> Campos corrigidos para minúsculas.")
             
     except Exception as e:
@@ -104,8 +145,7 @@ else:
             vector_layer_count += 1
             
             # Limpa o nome da camada para ser usado no nome do arquivo
-            # Adicionei mais .replace() para cobrir outros caracteres comuns
-            clean_layer_name = layer.name().replace(' ', '_').replace('-', '_').replace('´', '_').replace('Á', 'A').replace('(', '').replace(')', '').replace('.', '').replace('ç', 'c').replace('ã', 'a').replace("'", '').replace(",", '').replace("á", 'a').replace("ó", 'o').replace("õ", 'o').replace("í", 'i').replace(";", '').replace("ú", 'u').replace("é", 'e').replace("Ú", 'U')
+            clean_layer_name = layer.name().translate(_TRANSLIT)
 
             
             # Monta o nome do arquivo com base no estilo escolhido
@@ -17,24 +17,36 @@
 # =============================================================================
 
 import os
+import contextlib
 import re
+import functools
+import struct
 import sys
 import sqlite3
 import unicodedata
 import traceback
-import tempfile
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime
+from urllib.request import pathname2url
 
 try:
     from qgis.core import (
         QgsApplication, QgsProject, QgsVectorLayer,
         QgsMapLayer, QgsMessageLog, Qgis
     )
+    from qgis.PyQt.QtCore import QVariant
+    from osgeo import gdal
     import processing
     INSIDE_QGIS = QgsApplication.instance() is not None
 except ImportError:
     print("ERRO: Este script requer QGIS/PyQGIS no PATH.")
     sys.exit(1)
 
+try:
+    from lxml import etree                      # opcional: reescrita de estilos via XML
+except ImportError:
+    etree = None
+
 # =============================================================================
 # ---              CONFIGURACOES DO USUARIO [ALTERAR AQUI]                  ---
 # =============================================================================
@@ -79,11 +91,26 @@ LOWERCASE_NAMES         = True             # True = nomes em minusculo
 DROP_STRING_LENGTH      = False            # True = remover limites de string
 FORCE_SINGLEPART        = False            #Força poligonos simples
 INVALID_FEATURES_FILTER = 1                # 0=ignorar | 1=pular invalidas | 2=parar
+UPLOAD_WORKERS          = 4                # uploads simultaneos para o PostGIS (conexoes no pool)
+
+# Opcoes do GDAL durante a gravacao do GPKG local: sem fsync a cada commit e journal
+# em memoria. Troca a seguranca contra queda de energia/travamento pela velocidade do
+# lote (o GPKG de saida e regerado a cada execucao). Restauradas apos cada gravacao (gdal_config).
+GPKG_WRITE_OPTIONS = {
+    'OGR_SQLITE_SYNCHRONOUS': 'OFF',
+    'OGR_SQLITE_JOURNAL':     'MEMORY',
+    'OGR_SQLITE_CACHE':       '1024',      # MB
+    'SQLITE_USE_OGR_VFS':     'YES',
+}
 
 # =============================================================================
 # --- SANITIZACAO ---
 # =============================================================================
 
+_NON_ALNUM = re.compile(r'[^a-zA-Z0-9]+')
+
+
+@functools.lru_cache(maxsize=4096)
 def sanitize_name(text, add_prefix=False):
     """
     snake_case minusculo + prefixo opcional + truncate.
@@ -97,7 +124,7 @@ def sanitize_name(text, add_prefix=False):
     text = unicodedata.normalize('NFD', text)
     text = "".join(c for c in text if unicodedata.category(c) != 'Mn')
     # 2. Nao alfanumerico -> underscore, colapsar multiplos, strip
-    text = re.sub(r'[^a-zA-Z0-9]+', '_', text).strip('_').lower()
+    text = _NON_ALNUM.sub('_', text).strip('_').lower()
     if not text:
         return f"{TABLE_PREFIX}sem_nome" if add_prefix else "sem_nome"
     # 3. Prefixo
@@ -107,18 +134,20 @@ def sanitize_name(text, add_prefix=False):
     return text[:TRUNCATE_LIMIT]
 
 
-def build_field_rename(layer):
+def build_field_rename(orig_names):
     """Retorna {nome_original: nome_snake_case}, resolve duplicatas com sufixo numerico."""
     field_rename = {}
     seen = set()
-    for field in layer.fields():
-        f_orig  = field.name()
+    next_suffix = {}   # proximo sufixo a testar por base, evita refazer a sondagem
+    for f_orig in orig_names:
         f_clean = sanitize_name(f_orig, add_prefix=False)
-        base = f_clean
-        count = 1
-        while f_clean in seen:
-            f_clean = f"{base}_{count}"
-            count += 1
+        if f_clean in seen:
+            base  = f_clean
+            count = next_suffix.get(base, 1)
+            while f_clean in seen:
+                f_clean = f"{base}_{count}"
+                count += 1
+            next_suffix[base] = count
         seen.add(f_clean)
         field_rename[f_orig] = f_clean
     return field_rename
@@ -128,17 +157,30 @@ def build_field_rename(layer):
 # --- LOG ---
 # =============================================================================
 
-def log(msg, level=None):
+_LOG_FLUSH_EVERY = 32   # mensagens comuns entre um flush e outro do stdout
+_log_pending     = 0
+
+
+def log(msg, level=None, flush=False):
+    """
+    Escreve no stdout e no painel de log do QGIS. O flush do stdout e feito a cada
+    _LOG_FLUSH_EVERY mensagens (ou na hora, para avisos e erros); a ordem com os
+    print() do script e mantida porque tudo passa pelo mesmo stdout.
+    """
+    global _log_pending
     if level is None:
         level = Qgis.MessageLevel.Info
     print(f"  {msg}")
-    sys.stdout.flush()
+    _log_pending += 1
+    if flush or _log_pending >= _LOG_FLUSH_EVERY:
+        sys.stdout.flush()
+        _log_pending = 0
     if INSIDE_QGIS:
         QgsMessageLog.logMessage(str(msg), 'Clean+Upload', level=level)
 
 def log_ok(msg):   log(f"OK  {msg}", Qgis.MessageLevel.Success)
-def log_warn(msg): log(f"AV  {msg}", Qgis.MessageLevel.Warning)
-def log_err(msg):  log(f"ERR {msg}", Qgis.MessageLevel.Critical)
+def log_warn(msg): log(f"AV  {msg}", Qgis.MessageLevel.Warning, flush=True)
+def log_err(msg):  log(f"ERR {msg}", Qgis.MessageLevel.Critical, flush=True)
 
 
 # =============================================================================
@@ -207,6 +249,104 @@ def pg_connect(creds):
         return None
 
 
+def pg_pool(creds, max_connections):
+    """Pool de conexoes para os uploads em paralelo (uma conexao por thread)."""
+    from psycopg2.pool import ThreadedConnectionPool
+    return ThreadedConnectionPool(
+        1,
+        max_connections,
+        host=creds["host"],
+        port=creds["port"],
+        dbname=creds["database"],
+        user=creds["user"],
+        password=creds["password"],
+    )
+
+
+# =============================================================================
+# --- GPKG local: copia direta GPKG -> GPKG ---
+# =============================================================================
+
+@contextlib.contextmanager
+def gdal_config(options):
+    """Aplica opcoes de configuracao do GDAL e restaura os valores anteriores na saida, mesmo com erro."""
+    previous = {key: gdal.GetConfigOption(key) for key in options}
+    for key, value in options.items():
+        gdal.SetConfigOption(key, value)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            gdal.SetConfigOption(key, value)
+
+
+def gpkg_source_table(layer):
+    """
+    Retorna (caminho, tabela) se a camada e uma tabela GPKG lida direto do arquivo
+    (sem filtro, sem edicoes pendentes e so com campos da fonte); senao None.
+    """
+    from qgis.core import QgsFields, QgsProviderRegistry
+    if layer.providerType() != 'ogr' or layer.subsetString() or layer.isModified():
+        return None
+    # Campos virtuais/de expressao ou de join nao existem na tabela: vao pelo QGIS
+    fields = layer.fields()
+    if any(fields.fieldOrigin(idx) != QgsFields.OriginProvider for idx in range(fields.count())):
+        return None
+    parts = QgsProviderRegistry.instance().decodeUri('ogr', layer.source())
+    path  = parts.get('path', '')
+    if not path.lower().endswith('.gpkg'):
+        return None
+    table = parts.get('layerName')
+    if not table:
+        # Sem layername na URI (ex.: GPKG de uma tabela so): o nome exibido no projeto
+        # nao e o nome da tabela; resolve pelo layerid (ou a primeira tabela) no GDAL
+        layer_id = parts.get('layerId')
+        ds = gdal.OpenEx(path, gdal.OF_VECTOR)
+        if ds is None:
+            return None
+        source_layer = ds.GetLayer(int(layer_id) if layer_id not in (None, '') else 0)
+        table = source_layer.GetName() if source_layer is not None else None
+        ds = None
+        if not table:
+            return None
+    return path, table
+
+
+def copy_gpkg_layer(layer, source, dest_path, table_name, field_rename):
+    """
+    Copia a tabela para o GPKG de saida com GDAL (VectorTranslate + SELECT com
+    os campos renomeados), sem passar cada feicao pelo QGIS/processing.
+    A chave primaria (fid) segue como FID; a geometria e gravada em "geom".
+    """
+    from qgis.core import QgsWkbTypes
+    path, table = source
+    pk_indexes  = set(layer.dataProvider().pkAttributeIndexes())
+    geom_source = layer.dataProvider().geometryColumnName() or "geom"
+
+    columns = []
+    for idx, field in enumerate(layer.fields()):
+        name = field.name()
+        if idx in pk_indexes:
+            columns.append(quote_ident(name))
+        else:
+            columns.append(f"{quote_ident(name)} AS {quote_ident(field_rename[name])}")
+    columns.append(quote_ident(geom_source))
+    geom_type = QgsWkbTypes.displayString(layer.wkbType())
+
+    result = gdal.VectorTranslate(
+        dest_path, path,
+        format='GPKG',
+        accessMode='update' if os.path.exists(dest_path) else None,
+        SQLStatement=f"SELECT {', '.join(columns)} FROM {quote_ident(table)}",
+        layerName=table_name,
+        geometryType=geom_type.upper() if geom_type and geom_type != 'Unknown' else None,
+        layerCreationOptions=['GEOMETRY_NAME=geom'],
+    )
+    if result is None:
+        raise RuntimeError(gdal.GetLastErrorMsg() or "VectorTranslate falhou")
+    result = None   # fecha o dataset e grava no disco
+
+
 # =============================================================================
 # --- GPKG local: layer_styles via SQLite ---
 # =============================================================================
@@ -229,30 +369,42 @@ CREATE TABLE IF NOT EXISTS layer_styles (
 );
 """
 
-def ensure_sqlite_layer_styles(gpkg_path):
-    con = sqlite3.connect(gpkg_path)
-    con.executescript(DDL_LAYER_STYLES_SQLITE)
-    con.commit()
-    con.close()
-
-
-def save_style_sqlite(gpkg_path, table_name, geom_col, qml_xml, sld_xml):
+def save_styles_sqlite(gpkg_path, styles):
+    """
+    Grava QML e SLD na layer_styles do GPKG local.
+    styles: lista de (table_name, geom_col, qml_xml, sld_xml).
+    Uma conexao e um commit para todas as camadas (DELETE/INSERT via executemany).
+    journal_mode=MEMORY vale so para esta conexao (nao fica gravado no arquivo,
+    ao contrario do WAL) e synchronous=OFF evita o fsync em pastas de rede/OneDrive.
+    """
     con = sqlite3.connect(gpkg_path)
-    cur = con.cursor()
-    cur.execute(
-        "DELETE FROM layer_styles WHERE f_table_name=? AND styleName=?",
-        (table_name, table_name)
-    )
-    cur.execute(
-        """INSERT INTO layer_styles
-           (f_table_catalog, f_table_schema, f_table_name,
-            f_geometry_column, styleName, styleQML, styleSLD,
-            useAsDefault, description, owner)
-           VALUES ('','',?,?,?,?,?,1,'','')""",
-        (table_name, geom_col, table_name, qml_xml, sld_xml)
-    )
-    con.commit()
-    con.close()
+    try:
+        con.execute("PRAGMA synchronous=OFF")
+        con.execute("PRAGMA journal_mode=MEMORY")
+        con.execute("PRAGMA temp_store=MEMORY")
+        cur = con.cursor()
+        # BEGIN explicito: o sqlite3 so abre a transacao sozinho antes de DML, e o
+        # CREATE TABLE ficaria em autocommit, fora da transacao dos DELETE/INSERT
+        cur.execute("BEGIN")
+        cur.execute(DDL_LAYER_STYLES_SQLITE)
+        cur.executemany(
+            "DELETE FROM layer_styles WHERE f_table_name=? AND styleName=?",
+            [(table_name, table_name) for table_name, *_ in styles]
+        )
+        cur.executemany(
+            """INSERT INTO layer_styles
+               (f_table_catalog, f_table_schema, f_table_name,
+                f_geometry_column, styleName, styleQML, styleSLD,
+                useAsDefault, description, owner)
+               VALUES ('','',?,?,?,?,?,1,'','')""",
+            [
+                (table_name, geom_col, table_name, qml_xml, sld_xml)
+                for table_name, geom_col, qml_xml, sld_xml in styles
+            ]
+        )
+        con.commit()
+    finally:
+        con.close()
 
 
 # =============================================================================
@@ -283,9 +435,13 @@ def get_geom_type_name(layer):
     return type_map.get(wkb_type, QgsWkbTypes.displayString(wkb_type))
 
 
-def save_style_pg(conn, db_name, schema, table_name, geom_col, geom_type, qml_xml, sld_xml):
+def save_styles_pg(conn, db_name, schema, styles):
     """
     Insere QML e SLD na tabela public.layer_styles do PostgreSQL.
+    styles: lista de (table_name, geom_col, geom_type, qml_xml, sld_xml).
+
+    DELETE e INSERT sao enviados em lote (execute_values, ate 1000 linhas por
+    comando) e confirmados em um unico commit.
 
     Correcoes aplicadas:
       - f_table_catalog : nome real do banco (db_name), nao string vazia
@@ -293,84 +449,343 @@ def save_style_pg(conn, db_name, schema, table_name, geom_col, geom_type, qml_xm
       - type            : tipo de geometria da camada (Point, Polygon, etc.)
     """
     from datetime import datetime
+    from psycopg2.extras import execute_values
     load_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     cur = conn.cursor()
-    cur.execute(
-        """DELETE FROM public.layer_styles
-           WHERE f_table_catalog=%s AND f_table_schema=%s
-             AND f_table_name=%s AND stylename=%s""",
-        (db_name, schema, table_name, table_name)
+    execute_values(
+        cur,
+        """DELETE FROM public.layer_styles AS s
+           USING (VALUES %s) AS v(f_table_catalog, f_table_schema, f_table_name, stylename)
+           WHERE s.f_table_catalog=v.f_table_catalog AND s.f_table_schema=v.f_table_schema
+             AND s.f_table_name=v.f_table_name AND s.stylename=v.stylename""",
+        [(db_name, schema, table_name, table_name) for table_name, *_ in styles],
+        page_size=1000,
     )
-    cur.execute(
+    execute_values(
+        cur,
         """INSERT INTO public.layer_styles
            (f_table_catalog, f_table_schema, f_table_name,
             f_geometry_column, stylename, styleqml, stylesld,
             useasdefault, description, type)
-           VALUES (%s, %s, %s, %s, %s,
-                   %s::xml, %s::xml,
-                   true, %s, %s)""",
-        (
-            db_name,
-            schema,
-            table_name,
-            geom_col,
-            table_name,
-            qml_xml,
-            sld_xml,
-            f"Carregado em {load_time}",   # description = data/hora do upload
-            geom_type,                      # type = tipo de geometria real
-        )
+           VALUES %s""",
+        [
+            (
+                db_name,
+                schema,
+                table_name,
+                geom_col,
+                table_name,
+                qml_xml,
+                sld_xml,
+                f"Carregado em {load_time}",   # description = data/hora do upload
+                geom_type,                      # type = tipo de geometria real
+            )
+            for table_name, geom_col, geom_type, qml_xml, sld_xml in styles
+        ],
+        template="(%s, %s, %s, %s, %s, %s::xml, %s::xml, true, %s, %s)",
+        page_size=1000,
     )
     conn.commit()
     cur.close()
 
 
 # =============================================================================
-# --- EXPORTAR QML + SLD via arquivo temporario ---
+# --- PostgreSQL: carga das camadas via COPY binario ---
+# =============================================================================
+
+# Tipo PostgreSQL e codificador binario (formato do COPY ... FORMAT BINARY) por tipo de campo
+_PG_EPOCH_DATE     = date(2000, 1, 1)
+_PG_EPOCH_DATETIME = datetime(2000, 1, 1)
+
+def _encode_int4(v):   return struct.pack('>i', int(v))
+def _encode_int8(v):   return struct.pack('>q', int(v))
+def _encode_float8(v): return struct.pack('>d', float(v))
+def _encode_bool(v):   return b'\x01' if v else b'\x00'
+def _encode_text(v):   return str(v).encode('utf-8')
+
+def _encode_date(v):
+    v = v.toPyDate() if hasattr(v, 'toPyDate') else v
+    return struct.pack('>i', (v - _PG_EPOCH_DATE).days)
+
+def _encode_timestamp(v):
+    v = v.toPyDateTime() if hasattr(v, 'toPyDateTime') else v
+    delta = v.replace(tzinfo=None) - _PG_EPOCH_DATETIME
+    return struct.pack('>q', (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+def _encode_time(v):
+    v = v.toPyTime() if hasattr(v, 'toPyTime') else v
+    return struct.pack('>q', ((v.hour * 60 + v.minute) * 60 + v.second) * 1000000 + v.microsecond)
+
+PG_TYPES = {
+    QVariant.Int:       ('integer',          _encode_int4),
+    QVariant.UInt:      ('bigint',           _encode_int8),
+    QVariant.LongLong:  ('bigint',           _encode_int8),
+    QVariant.ULongLong: ('bigint',           _encode_int8),
+    QVariant.Double:    ('double precision', _encode_float8),
+    QVariant.Bool:      ('boolean',          _encode_bool),
+    QVariant.Date:      ('date',             _encode_date),
+    QVariant.DateTime:  ('timestamp',        _encode_timestamp),
+    QVariant.Time:      ('time',             _encode_time),
+}
+PG_TYPE_DEFAULT = ('text', _encode_text)
+
+
+def quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def pg_column_type(field):
+    """Tipo da coluna no PostgreSQL; texto com limite vira varchar(n) se DROP_STRING_LENGTH = False."""
+    pg_type, encode = PG_TYPES.get(field.type(), PG_TYPE_DEFAULT)
+    if pg_type == 'text' and field.type() == QVariant.String and field.length() > 0 and not DROP_STRING_LENGTH:
+        pg_type = f"varchar({field.length()})"
+    return pg_type, encode
+
+
+def to_ewkb(wkb, srid):
+    """Converte WKB em EWKB inserindo o SRID logo apos o tipo da geometria."""
+    order    = '<' if wkb[0] == 1 else '>'
+    wkb_type = struct.unpack(order + 'I', wkb[1:5])[0]
+    return wkb[:1] + struct.pack(order + 'II', wkb_type | 0x20000000, srid) + wkb[5:]
+
+
+def pg_geometry_type(wkb_type):
+    """
+    Tipo da coluna geometry no PostGIS: Unknown/NoGeometry viram Geometry e os
+    tipos 2.5D (ex.: MultiPolygon25D) usam a grafia Z (MultiPolygonZ).
+    """
+    from qgis.core import QgsWkbTypes
+    flat = QgsWkbTypes.flatType(wkb_type)
+    if flat in (QgsWkbTypes.Unknown, QgsWkbTypes.NoGeometry):
+        return 'Geometry'
+    return QgsWkbTypes.displayString(
+        QgsWkbTypes.zmType(flat, QgsWkbTypes.hasZ(wkb_type), QgsWkbTypes.hasM(wkb_type))
+    )
+
+
+class CopyStream:
+    """
+    Fluxo binario do COPY gerado sob demanda (objeto tipo arquivo lido pelo copy_expert):
+    cada tupla e montada quando o PostgreSQL pede mais dados, sem materializar a camada.
+    Le as feicoes de um QgsVectorLayerFeatureSource, criado na thread principal e seguro
+    para iterar na thread de upload.
+    Geometrias invalidas seguem INVALID_FEATURES_FILTER (0=ignorar | 1=pular | 2=parar);
+    as puladas ficam em skipped. Com FORCE_SINGLEPART, feicoes multipartes viram uma tupla por parte.
+    """
+
+    def __init__(self, source, encoders, srid):
+        self.skipped  = 0
+        self._chunks  = self._rows(source, encoders, srid)
+        self._pending = bytearray()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._pending += chunk
+        if size < 0:
+            size = len(self._pending)
+        data = bytes(self._pending[:size])
+        del self._pending[:size]
+        return data
+
+    def _rows(self, source, encoders, srid):
+        yield b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+        row_header = struct.pack('>h', len(encoders) + 1)
+        null       = struct.pack('>i', -1)
+        for feature in source.getFeatures():
+            geometry = feature.geometry()
+            has_geom = geometry is not None and not geometry.isNull()
+            if has_geom and INVALID_FEATURES_FILTER and not geometry.isGeosValid():
+                if INVALID_FEATURES_FILTER == 2:
+                    raise RuntimeError(f"geometria invalida na feicao {feature.id()}")
+                self.skipped += 1
+                continue
+            row = bytearray(row_header)   # atributos codificados uma vez, repetidos por parte
+            for value, encode in zip(feature.attributes(), encoders):
+                if value is None or (isinstance(value, QVariant) and value.isNull()):
+                    row += null
+                else:
+                    data = encode(value)
+                    row += struct.pack('>i', len(data))
+                    row += data
+            parts = [geometry] if has_geom else []
+            if has_geom and FORCE_SINGLEPART and geometry.isMultipart():
+                # Uma linha por parte (como o -explodecollections): a coluna e do tipo simples
+                parts = geometry.asGeometryCollection()
+            if not parts:
+                yield bytes(row + null)
+                continue
+            for part in parts:
+                data = to_ewkb(bytes(part.asWkb()), srid)
+                yield b''.join((row, struct.pack('>i', len(data)), data))
+        yield struct.pack('>h', -1)
+
+
+def prepare_import_pg(layer, table_name, field_rename):
+    """
+    Le a estrutura da camada (na thread principal, onde os objetos do QGIS podem ser usados)
+    e devolve o que o upload precisa: comandos SQL e o fluxo do COPY, que le as feicoes
+    sob demanda na thread de upload.
+    Substitui o native:importintopostgis, que insere linha a linha.
+    """
+    from qgis.core import QgsVectorLayerFeatureSource, QgsWkbTypes
+    fields  = layer.fields()
+    columns = [field_rename[field.name()] for field in fields]
+    if LOWERCASE_NAMES:
+        columns    = [col.lower() for col in columns]
+        table_name = table_name.lower()
+    types  = [pg_column_type(field) for field in fields]
+    srid   = layer.crs().postgisSrid()
+    target = f"{quote_ident(PG_SCHEMA)}.{quote_ident(table_name)}"
+
+    wkb_type = layer.wkbType()
+    if FORCE_SINGLEPART:
+        wkb_type = QgsWkbTypes.singleType(wkb_type)
+    geom_type = pg_geometry_type(wkb_type)
+
+    column_ddl = [f"{quote_ident(col)} {pg_type}" for col, (pg_type, _) in zip(columns, types)]
+    if 'id' not in columns:
+        column_ddl.insert(0, "id serial PRIMARY KEY")
+    column_ddl.append(f"{quote_ident(PG_GEOMETRY_COLUMN)} geometry({geom_type}, {srid})")
+    copy_columns = ", ".join(quote_ident(col) for col in columns + [PG_GEOMETRY_COLUMN])
+
+    ddl = [f"CREATE TABLE {target} ({', '.join(column_ddl)})"]
+    if OVERWRITE:
+        ddl.insert(0, f"DROP TABLE IF EXISTS {target}")
+    return {
+        'target':   target,
+        'ddl':      ddl,
+        'copy_sql': f"COPY {target} ({copy_columns}) FROM STDIN WITH (FORMAT BINARY)",
+        'stream':   CopyStream(QgsVectorLayerFeatureSource(layer), [encode for _, encode in types], srid),
+    }
+
+
+def upload_import_pg(pool, job):
+    """
+    Executa a carga em uma conexao do pool (roda nas threads de upload).
+    Tabela, COPY, indice espacial e ANALYZE ficam em uma unica transacao.
+    Retorna o numero de feicoes invalidas puladas.
+    """
+    conn = pool.getconn()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                for statement in job['ddl']:
+                    cur.execute(statement)
+                cur.copy_expert(job['copy_sql'], job['stream'])
+                # Indice espacial e estatisticas so depois da carga completa
+                if CREATE_INDEX:
+                    cur.execute(f"CREATE INDEX ON {job['target']} USING GIST ({quote_ident(PG_GEOMETRY_COLUMN)})")
+                cur.execute(f"ANALYZE {job['target']}")
+    finally:
+        pool.putconn(conn)
+    return job['stream'].skipped
+
+
+def collect_uploads(pending, wait_all=False):
+    """
+    Reporta os uploads concluidos.
+    Retorna (uploads em andamento, tabelas carregadas, numero de falhas).
+    """
+    done, not_done = wait(pending, return_when=ALL_COMPLETED if wait_all else FIRST_COMPLETED)
+    loaded, failed = [], 0
+    for future in done:
+        orig_name, clean_name = pending[future]
+        try:
+            skipped = future.result()
+            if skipped:
+                log_warn(f"{skipped} feicoes com geometria invalida ignoradas em '{orig_name}'")
+            log_ok(f"✅🛢️⬆️ PostGIS: {PG_SCHEMA}.{clean_name}")
+            loaded.append(clean_name)
+        except Exception as e:
+            log_err(f"❌🛢️⬆️ Erro ao importar '{orig_name}' para PostGIS: {e}")
+            traceback.print_exception(type(e), e, e.__traceback__)
+            failed += 1
+    return {future: pending[future] for future in not_done}, loaded, failed
+
+
+# =============================================================================
+# --- EXPORTAR QML + SLD em memoria ---
 # =============================================================================
 
+OGC_PROPERTY_NAME = '{http://www.opengis.net/ogc}PropertyName'
+
+
+def field_name_alternation(renamed):
+    """
+    Monta a alternancia regex com os nomes antigos (mais longos primeiro),
+    compartilhada pelas substituicoes textuais de QML e SLD.
+    """
+    return '|'.join(map(re.escape, sorted(renamed, key=len, reverse=True)))
+
+
+def rename_fields_qml(qml_xml, renamed):
+    """
+    Renomeia campos no QML: atributos field="...", <field name="...">
+    e elementos cujo texto e exatamente o nome do campo.
+    Com lxml o XML e lido uma vez e alterado no lugar; sem lxml, substituicao textual.
+    """
+    if not qml_xml or not renamed:
+        return qml_xml
+    if etree is None:
+        # As tres formas (field="x", <field name="x", >x</) numa unica passada
+        names = field_name_alternation(renamed)
+        pattern = re.compile(f'(field="|<field name=")({names})(?=")|(>)({names})(?=</)')
+        return pattern.sub(
+            lambda m: (m.group(1) + renamed[m.group(2)]) if m.group(1)
+                      else (m.group(3) + renamed[m.group(4)]),
+            qml_xml)
+
+    root = etree.fromstring(qml_xml.encode('utf-8'))
+    for el in root.iter(etree.Element):
+        if el.get('field') in renamed:
+            el.set('field', renamed[el.get('field')])
+        if el.tag == 'field' and el.get('name') in renamed:
+            el.set('name', renamed[el.get('name')])
+        if len(el) == 0 and el.text in renamed:
+            el.text = renamed[el.text]
+    return etree.tostring(root.getroottree(), encoding='unicode')
+
+
+def rename_fields_sld(sld_xml, renamed):
+    """Renomeia campos nos <ogc:PropertyName> do SLD (lxml, ou substituicao textual)."""
+    if not sld_xml or not renamed:
+        return sld_xml
+    if etree is None:
+        names = field_name_alternation(renamed)
+        pattern = re.compile(f'(?<=<ogc:PropertyName>)({names})(?=</ogc:PropertyName>)')
+        return pattern.sub(lambda m: renamed[m.group(1)], sld_xml)
+
+    root = etree.fromstring(sld_xml.encode('utf-8'))
+    for el in root.iter(OGC_PROPERTY_NAME):
+        name = (el.text or '').strip()
+        if name in renamed:
+            el.text = renamed[name]
+    return etree.tostring(root.getroottree(), encoding='unicode')
+
+
 def export_styles(layer, field_rename):
     """
-    Grava QML e SLD em arquivos temp, le o conteudo,
-    substitui nomes de campos antigos pelos novos no XML.
+    Serializa QML e SLD em memoria (QDomDocument), sem arquivos temporarios,
+    e substitui nomes de campos antigos pelos novos no XML.
     Retorna (qml_str, sld_str).
     """
-    tmp_dir  = tempfile.mkdtemp()
-    qml_path = os.path.join(tmp_dir, "style.qml")
-    sld_path = os.path.join(tmp_dir, "style.sld")
+    from qgis.PyQt.QtXml import QDomDocument
+    renamed = {fo: fc for fo, fc in field_rename.items() if fo != fc}
 
     # QML
     qml_xml = ""
-    layer.saveNamedStyle(qml_path)
-    if os.path.exists(qml_path):
-        with open(qml_path, 'r', encoding='utf-8') as f:
-            qml_xml = f.read()
-        os.remove(qml_path)
-        for f_orig, f_clean in field_rename.items():
-            if f_orig != f_clean:
-                qml_xml = qml_xml.replace(f'field="{f_orig}"',      f'field="{f_clean}"')
-                qml_xml = qml_xml.replace(f'<field name="{f_orig}"', f'<field name="{f_clean}"')
-                qml_xml = qml_xml.replace(f'>{f_orig}</',            f'>{f_clean}</')
+    qml_doc = QDomDocument()
+    if not layer.exportNamedStyle(qml_doc):       # retorna a mensagem de erro ("" = ok)
+        qml_xml = rename_fields_qml(qml_doc.toString(), renamed)
 
     # SLD
-    sld_xml = ""
-    layer.saveSldStyle(sld_path)
-    if os.path.exists(sld_path):
-        with open(sld_path, 'r', encoding='utf-8') as f:
-            sld_xml = f.read()
-        os.remove(sld_path)
-        for f_orig, f_clean in field_rename.items():
-            if f_orig != f_clean:
-                sld_xml = sld_xml.replace(
-                    f'<ogc:PropertyName>{f_orig}</ogc:PropertyName>',
-                    f'<ogc:PropertyName>{f_clean}</ogc:PropertyName>'
-                )
-
-    try:
-        os.rmdir(tmp_dir)
-    except Exception:
-        pass
+    sld_doc = QDomDocument()
+    layer.exportSldStyle(sld_doc, "")
+    sld_xml = rename_fields_sld(sld_doc.toString(), renamed)
 
     return qml_xml, sld_xml
 
@@ -387,14 +802,15 @@ def parse_sublayer_name(sub):
     return parts[1].strip() if len(parts) > 1 else None
 
 
-# Tabelas internas do GPKG/QGIS que devem ser ignoradas
-GPKG_INTERNAL_TABLES = {
+# Tabelas internas do GPKG/QGIS que devem ser ignoradas (nomes ja em minusculo).
+# No GPKG em disco a gpkg_contents (data_type = 'features') ja filtra a maioria.
+GPKG_INTERNAL_TABLES = frozenset({
     "layer_styles", "qgis_projects", "gpkg_contents",
     "gpkg_geometry_columns", "gpkg_spatial_ref_sys",
     "gpkg_extensions", "gpkg_metadata", "gpkg_metadata_reference",
     "gpkg_data_columns", "gpkg_data_column_constraints",
     "gpkg_tile_matrix", "gpkg_tile_matrix_set",
-}
+})
 
 
 def is_valid_geo_layer(layer):
@@ -417,6 +833,24 @@ def is_valid_geo_layer(layer):
     return True
 
 
+def list_gpkg_feature_tables(path):
+    """
+    Le as tabelas de feicoes direto da gpkg_contents (sqlite, somente leitura),
+    sem abrir cada tabela pelo OGR. Retorna None se a gpkg_contents nao puder ser lida.
+    """
+    try:
+        con = sqlite3.connect(f"file:{pathname2url(path)}?mode=ro", uri=True)
+        try:
+            return [row[0] for row in con.execute(
+                "SELECT table_name FROM gpkg_contents WHERE data_type = 'features' ORDER BY rowid"
+            )]
+        finally:
+            con.close()
+    except sqlite3.Error as e:
+        log_warn(f"gpkg_contents ilegivel ({e}), listando pelo provedor OGR")
+        return None
+
+
 def get_layers_to_process():
     layers = []
     if USE_OPEN_LAYERS:
@@ -444,12 +878,15 @@ def get_layers_to_process():
         if not os.path.exists(INPUT_GPKG):
             log_err(f"Arquivo nao encontrado: {INPUT_GPKG}")
             return []
-        gpkg_obj = QgsVectorLayer(INPUT_GPKG, "temp", "ogr")
-        if not gpkg_obj.isValid():
-            log_err(f"GPKG invalido: {INPUT_GPKG}")
-            return []
-        for sub in gpkg_obj.dataProvider().subLayers():
-            name = parse_sublayer_name(sub)
+        # Tabelas internas e sem geometria ja ficam de fora aqui, antes de abrir pelo OGR
+        names = list_gpkg_feature_tables(INPUT_GPKG)
+        if names is None:
+            gpkg_obj = QgsVectorLayer(INPUT_GPKG, "temp", "ogr")
+            if not gpkg_obj.isValid():
+                log_err(f"GPKG invalido: {INPUT_GPKG}")
+                return []
+            names = [parse_sublayer_name(sub) for sub in gpkg_obj.dataProvider().subLayers()]
+        for name in names:
             if not name:
                 continue
             if name.lower() in GPKG_INTERNAL_TABLES:
@@ -563,14 +1000,29 @@ def main():
     sucesso_gpkg = 0
     sucesso_pg   = 0
     falha        = 0
+    local_styles = []   # (table_name, geom_col, qml_xml, sld_xml)
+    pg_styles    = []   # (table_name, geom_col, geom_type, qml_xml, sld_xml)
+
+    # Preparacao das camadas, GPKG local e estilos seguem na thread principal (PyQGIS/processing
+    # nao sao thread-safe); o upload (COPY + indice + ANALYZE) roda em UPLOAD_WORKERS threads,
+    # cada uma com sua conexao do pool, lendo as feicoes sob demanda pela fonte de feicoes
+    # (QgsVectorLayerFeatureSource) do job enquanto a proxima camada e preparada.
+    pool, executor = None, None
+    if UPLOAD_TO_POSTGIS:
+        pool     = pg_pool(creds, UPLOAD_WORKERS)
+        executor = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS)
+    pending        = {}   # future -> (orig_name, clean_name)
+    pending_styles = {}   # clean_name -> linha da public.layer_styles, gravada se o upload der certo
 
     for i, l_data in enumerate(layers, 1):
         layer      = l_data['obj']
         orig_name  = l_data['name_orig']
         clean_name = l_data['name_clean']
 
-        # Mapa de renomeacao de campos
-        field_rename = build_field_rename(layer)
+        # Campos lidos uma vez por camada (mapa de renomeacao e field_map)
+        fields       = list(layer.fields())
+        field_names  = [field.name() for field in fields]
+        field_rename = build_field_rename(field_names)
 
         print(f"[{i}/{len(layers)}]  {orig_name}  ->  {clean_name}")
         for fo, fc in field_rename.items():
@@ -579,13 +1031,13 @@ def main():
 
         # field_map para refactorfields
         field_map = []
-        for field in layer.fields():
+        for field, name in zip(fields, field_names):
             field_map.append({
-                'name':       field_rename[field.name()],
+                'name':       field_rename[name],
                 'type':       field.type(),
                 'length':     field.length(),
                 'precision':  field.precision(),
-                'expression': f'"{field.name()}"',
+                'expression': f'"{name}"',
             })
 
         # Detectar coluna de geometria
@@ -598,15 +1050,21 @@ def main():
         # --- A: Salvar no GPKG local ---
         if GENERATE_LOCAL_GPKG:
             try:
-                output_uri = (
-                    f"ogr:dbname='{final_output}' "
-                    f"table=\"{clean_name}\" (geom) format=GPKG"
-                )
-                processing.run("native:refactorfields", {
-                    'INPUT':          layer,
-                    'FIELDS_MAPPING': field_map,
-                    'OUTPUT':         output_uri,
-                })
+                source = gpkg_source_table(layer)
+                with gdal_config(GPKG_WRITE_OPTIONS):
+                    if source:
+                        # GPKG -> GPKG: copia direta pelo GDAL, so renomeando campos
+                        copy_gpkg_layer(layer, source, final_output, clean_name, field_rename)
+                    else:
+                        output_uri = (
+                            f"ogr:dbname='{final_output}' "
+                            f"table=\"{clean_name}\" (geom) format=GPKG"
+                        )
+                        processing.run("native:refactorfields", {
+                            'INPUT':          layer,
+                            'FIELDS_MAPPING': field_map,
+                            'OUTPUT':         output_uri,
+                        })
                 log_ok(f"✅📂🖥️ GPKG local: {clean_name}")
                 sucesso_gpkg += 1
 
@@ -628,13 +1086,8 @@ def main():
             traceback.print_exc()
 
         if GENERATE_LOCAL_GPKG and GENERATE_LOCAL_STYLES and (qml_xml or sld_xml):
-            try:
-                ensure_sqlite_layer_styles(final_output)
-                save_style_sqlite(final_output, clean_name, geom_col, qml_xml, sld_xml)
-                log_ok(f"✅📂🖼️ Estilos GPKG (QML+SLD): {clean_name}")
-            except Exception as e:
-                log_warn(f"❌📂🖼️ Estilos GPKG nao gravados para '{orig_name}': {e}")
-                traceback.print_exc()
+            # gravados em lote apos o loop
+            local_styles.append((clean_name, geom_col, qml_xml, sld_xml))
         elif not GENERATE_LOCAL_STYLES:
             log(f"[SKIP] Estilos GPKG local desligado: {clean_name}")
 
@@ -642,8 +1095,9 @@ def main():
         if GENERATE_SLD_FILES and sld_folder and sld_xml:
             try:
                 sld_file = os.path.join(sld_folder, f"{clean_name}.sld")
-                with open(sld_file, 'w', encoding='utf-8') as f:
-                    f.write(sld_xml)
+                # bytes codificados uma vez, sem camada de texto (e sem traduzir \n no Windows)
+                with open(sld_file, 'wb') as f:
+                    f.write(sld_xml.encode('utf-8'))
                 log_ok(f"SLD salvo: {sld_file}")
             except Exception as e:
                 log_warn(f"Erro ao salvar SLD de '{orig_name}': {e}")
@@ -653,31 +1107,16 @@ def main():
         # --- C: Importar para PostgreSQL ---
         if UPLOAD_TO_POSTGIS:
             try:
-                result = processing.run("native:refactorfields", {
-                    'INPUT':          layer,
-                    'FIELDS_MAPPING': field_map,
-                    'OUTPUT':         'memory:',
-                })
-                layer_clean = result['OUTPUT']
-
-                # native:importintopostgis espera o NOME DA CONEXAO salva
-                # no QGIS (campo DATABASE), nao o nome do banco
-                processing.run("native:importintopostgis", {
-                    'INPUT':                   layer_clean,
-                    'DATABASE':                PG_CONNECTION_NAME,
-                    'SCHEMA':                  PG_SCHEMA,
-                    'TABLENAME':               clean_name,
-                    'GEOMETRY_COLUMN':         PG_GEOMETRY_COLUMN,
-                    'ENCODING':                'UTF-8',
-                    'OVERWRITE':               OVERWRITE,
-                    'CREATEINDEX':             CREATE_INDEX,
-                    'LOWERCASE_NAMES':         LOWERCASE_NAMES,
-                    'DROP_STRING_LENGTH':      DROP_STRING_LENGTH,
-                    'FORCE_SINGLEPART':        FORCE_SINGLEPART,
-                    'INVALID_FEATURES_FILTER': INVALID_FEATURES_FILTER,
-                })
-                log_ok(f"✅🛢️⬆️ PostGIS: {PG_SCHEMA}.{clean_name}")
-                sucesso_pg += 1
+                # COPY binario com os campos renomeados, enviado por uma thread de upload
+                job = prepare_import_pg(layer, clean_name, field_rename)
+
+                # Limita os uploads em andamento (cada um com uma fonte de feicoes aberta)
+                if len(pending) >= UPLOAD_WORKERS:
+                    pending, loaded, failed = collect_uploads(pending)
+                    sucesso_pg += len(loaded)
+                    falha      += failed
+                    pg_styles.extend(pending_styles.pop(t) for t in loaded if t in pending_styles)
+                pending[executor.submit(upload_import_pg, pool, job)] = (orig_name, clean_name)
 
             except Exception as e:
                 log_err(f"❌🛢️⬆️ Erro ao importar '{orig_name}' para PostGIS: {e}")
@@ -690,21 +1129,47 @@ def main():
 
         # --- D: Gravar estilos na public.layer_styles do PostgreSQL ---
         if UPLOAD_STYLES_TO_PG and (qml_xml or sld_xml):
-            try:
-                save_style_pg(pg_conn, creds['database'], PG_SCHEMA, clean_name, geom_col, get_geom_type_name(layer), qml_xml, sld_xml)
-                log_ok(f"✅🛢️🖼️ Estilos PostGIS (public.layer_styles): {clean_name}")
-            except Exception as e:
-                log_warn(f"❌🛢️🖼️ Estilos PostGIS nao gravados para '{orig_name}': {e}")
-                traceback.print_exc()
-                try:
-                    pg_conn.rollback()
-                except Exception:
-                    pass
+            # gravados em lote apos o loop (se houver upload, so depois da tabela carregada)
+            style_row = (clean_name, geom_col, get_geom_type_name(layer), qml_xml, sld_xml)
+            if UPLOAD_TO_POSTGIS:
+                pending_styles[clean_name] = style_row
+            else:
+                pg_styles.append(style_row)
         elif not UPLOAD_STYLES_TO_PG:
             log(f"[SKIP] Estilos PostGIS desligado: {clean_name}")
 
         print()
 
+    if executor:
+        if pending:
+            _, loaded, failed = collect_uploads(pending, wait_all=True)
+            sucesso_pg += len(loaded)
+            falha      += failed
+            pg_styles.extend(pending_styles.pop(t) for t in loaded if t in pending_styles)
+        executor.shutdown()
+        pool.closeall()
+
+    # --- Estilos em lote: um commit no GPKG local e um no PostgreSQL ---
+    if local_styles:
+        try:
+            save_styles_sqlite(final_output, local_styles)
+            log_ok(f"✅📂🖼️ Estilos GPKG (QML+SLD): {len(local_styles)} camadas")
+        except Exception as e:
+            log_warn(f"❌📂🖼️ Estilos GPKG nao gravados: {e}")
+            traceback.print_exc()
+
+    if pg_styles:
+        try:
+            save_styles_pg(pg_conn, creds['database'], PG_SCHEMA, pg_styles)
+            log_ok(f"✅🛢️🖼️ Estilos PostGIS (public.layer_styles): {len(pg_styles)} camadas")
+        except Exception as e:
+            log_warn(f"❌🛢️🖼️ Estilos PostGIS nao gravados: {e}")
+            traceback.print_exc()
+            try:
+                pg_conn.rollback()
+            except Exception:
+                pass
+
     if pg_conn:
         pg_conn.close()
 
@@ -719,6 +1184,7 @@ def main():
         print(f" 🛢️ PostGIS    : {sucesso_pg} camadas   ->  {creds['database']}.{PG_SCHEMA}")
     print(f"  ❌ Erros      : {falha}")
     print("=" * 60)
+    sys.stdout.flush()
 
 
 # =============================================================================
@@ -18,23 +18,35 @@
 
 import os
 import re
+import functools
+import struct
 import sys
 import sqlite3
+import threading
 import unicodedata
 import traceback
-import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from queue import Empty, Full, Queue
+from datetime import date, datetime
 
 try:
     from qgis.core import (
         QgsApplication, QgsProject, QgsVectorLayer,
         QgsMapLayer, QgsMessageLog, Qgis
     )
+    from qgis.PyQt.QtCore import QVariant
+    from osgeo import gdal
     import processing
     INSIDE_QGIS = QgsApplication.instance() is not None
 except ImportError:
     print("ERRO: Este script requer QGIS/PyQGIS no PATH.")
     sys.exit(1)
 
+try:
+    from lxml import etree                      # opcional: reescrita de estilos via XML
+except ImportError:
+    etree = None
+
 # =============================================================================
 # ---              CONFIGURACOES DO USUARIO [ALTERAR AQUI]                  ---
 # =============================================================================
@@ -68,18 +80,36 @@ LOWERCASE_NAMES         = True             # True = nomes em minusculo
 DROP_STRING_LENGTH      = False            # True = remover limites de string
 FORCE_SINGLEPART        = False            # True = forcar singlepart
 INVALID_FEATURES_FILTER = 1                # 0=ignorar | 1=pular invalidas | 2=parar
+# Obs.: a copia direta GPKG -> PostGIS pelo GDAL (mais rapida) so e usada com
+# INVALID_FEATURES_FILTER = 0 e FORCE_SINGLEPART = False; com o filtro ligado (padrao)
+# as geometrias sao validadas no QGIS (GEOS) e enviadas pelo COPY binario.
+UPLOAD_WORKERS          = 2                # threads de COPY consumindo a fila de upload
+INDEX_WORKERS           = 4                # tabelas finalizadas em paralelo (indice + ANALYZE)
 
 # =============================================================================
 # --- SANITIZACAO ---
 # =============================================================================
 
+_NON_ALNUM = re.compile(r'[^a-zA-Z0-9]+')
+
+# Acentos comuns do portugues -> ASCII em uma unica passada (caminho rapido)
+_ASCII_FOLD = str.maketrans(
+    'áàâãäéèêëíìîïóòôõöúùûüçÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇñÑ',
+    'aaaaaeeeeiiiiooooouuuucAAAAAEEEEIIIIOOOOOUUUUCnN',
+)
+
+
+@functools.lru_cache(maxsize=4096)
 def sanitize_name(text, add_prefix=False):
     """camelCase + prefixo opcional + truncate."""
     if not text or not text.strip():
         return f"{TABLE_PREFIX}semNome" if add_prefix else "semNome"
-    text = unicodedata.normalize('NFD', text)
-    text = "".join(c for c in text if unicodedata.category(c) != 'Mn')
-    words = re.sub(r'[^a-zA-Z0-9]+', ' ', text).split()
+    text = text.translate(_ASCII_FOLD)
+    if not text.isascii():
+        # Outros caracteres acentuados: NFD + remocao das marcas combinantes
+        text = unicodedata.normalize('NFD', text)
+        text = "".join(c for c in text if unicodedata.category(c) != 'Mn')
+    words = _NON_ALNUM.sub(' ', text).split()
     if not words:
         return f"{TABLE_PREFIX}semNome" if add_prefix else "semNome"
     camel = words[0].lower() + "".join(w.capitalize() for w in words[1:])
@@ -88,9 +118,14 @@ def sanitize_name(text, add_prefix=False):
     return camel[:TRUNCATE_LIMIT]
 
 
-def build_field_rename(layer):
-    """Retorna {nome_original: nome_camelCase}, resolve duplicatas com sufixo."""
+def build_field_maps(layer):
+    """
+    Percorre os campos uma unica vez e retorna:
+      - {nome_original: nome_camelCase}, com duplicatas resolvidas por sufixo
+      - field_map para o native:refactorfields
+    """
     field_rename = {}
+    field_map    = []
     seen = set()
     for field in layer.fields():
         f_orig  = field.name()
@@ -102,7 +137,14 @@ def build_field_rename(layer):
             count += 1
         seen.add(f_clean)
         field_rename[f_orig] = f_clean
-    return field_rename
+        field_map.append({
+            'name':       f_clean,
+            'type':       field.type(),
+            'length':     field.length(),
+            'precision':  field.precision(),
+            'expression': f'"{f_orig}"',
+        })
+    return field_rename, field_map
 
 
 # =============================================================================
@@ -168,18 +210,26 @@ def get_pg_credentials(connection_name):
     }
 
 
-def pg_connect(creds):
-    """Abre conexao psycopg2 com as credenciais do QGIS."""
+def pg_pool(creds, max_connections):
+    """
+    Abre o pool de conexoes psycopg2 com as credenciais do QGIS. Cada thread
+    (upload, finalizacao de tabelas, estilos) pega uma conexao e devolve ao terminar,
+    sem refazer o handshake TCP/autenticacao a cada uso.
+    """
     try:
-        import psycopg2
-        conn = psycopg2.connect(
+        from psycopg2.pool import ThreadedConnectionPool
+        return ThreadedConnectionPool(
+            1,
+            max_connections,
             host=creds["host"],
             port=creds["port"],
             dbname=creds["database"],
             user=creds["user"],
             password=creds["password"],
+            application_name="clean_and_export_gpkg",
+            keepalives=1,
+            keepalives_idle=60,
         )
-        return conn
     except ImportError:
         log_err("psycopg2 nao instalado. No OSGeo4W Shell: pip install psycopg2-binary")
         return None
@@ -188,6 +238,116 @@ def pg_connect(creds):
         return None
 
 
+# =============================================================================
+# --- GPKG local: copia direta GPKG -> GPKG ---
+# =============================================================================
+
+def open_output_gpkg(gpkg_path):
+    """Abre (ou cria) o GPKG de saida uma vez para todas as camadas copiadas pelo GDAL."""
+    if os.path.exists(gpkg_path):
+        ds = gdal.OpenEx(gpkg_path, gdal.OF_VECTOR | gdal.OF_UPDATE)
+    else:
+        ds = gdal.GetDriverByName('GPKG').Create(gpkg_path, 0, 0, 0, gdal.GDT_Unknown)
+    if ds is None:
+        raise RuntimeError(gdal.GetLastErrorMsg() or f"nao foi possivel abrir {gpkg_path}")
+    return ds
+
+
+def gpkg_source_table(layer):
+    """
+    Retorna (caminho, tabela) se a camada e uma tabela GPKG lida direto do arquivo
+    (sem filtro, sem edicoes pendentes e so com campos da fonte); senao None.
+    """
+    from qgis.core import QgsFields, QgsProviderRegistry
+    if layer.providerType() != 'ogr' or layer.subsetString() or layer.isModified():
+        return None
+    # Campos virtuais/de expressao ou de join nao existem na tabela: vao pelo QGIS
+    fields = layer.fields()
+    if any(fields.fieldOrigin(idx) != QgsFields.OriginProvider for idx in range(fields.count())):
+        return None
+    parts = QgsProviderRegistry.instance().decodeUri('ogr', layer.source())
+    path  = parts.get('path', '')
+    if not path.lower().endswith('.gpkg'):
+        return None
+    table = parts.get('layerName')
+    if not table:
+        # Sem layername na URI (ex.: GPKG de uma tabela so): o nome exibido no projeto
+        # nao e o nome da tabela; resolve pelo layerid (ou a primeira tabela) no GDAL
+        layer_id = parts.get('layerId')
+        ds = gdal.OpenEx(path, gdal.OF_VECTOR)
+        if ds is None:
+            return None
+        source_layer = ds.GetLayer(int(layer_id) if layer_id not in (None, '') else 0)
+        table = source_layer.GetName() if source_layer is not None else None
+        ds = None
+        if not table:
+            return None
+    return path, table
+
+
+def gdal_geometry_type(layer):
+    """Tipo de geometria para o VectorTranslate (-nlt): NONE em tabelas sem geometria."""
+    from qgis.core import QgsWkbTypes
+    if layer.wkbType() == QgsWkbTypes.NoGeometry:
+        return 'NONE'
+    geom_type = QgsWkbTypes.displayString(layer.wkbType())
+    return geom_type.upper() if geom_type and geom_type != 'Unknown' else None
+
+
+def build_rename_select(layer, table, field_rename, lowercase=False, pk_as_field=False):
+    """
+    SELECT que le a tabela GPKG de origem ja com os campos renomeados; usado tanto
+    na copia para o GPKG local quanto no envio ao PostgreSQL, em streaming pelo GDAL.
+    A chave primaria (fid) vai primeiro, com o nome original, e vira o FID do destino;
+    com pk_as_field=True ela vira um campo comum renomeado (o CAST tira a origem da
+    coluna, entao o GDAL nao a reconhece como FID), como no COPY.
+    Tabelas sem geometria nao levam a coluna de geometria.
+    Retorna (sql, colunas renomeadas).
+    """
+    from qgis.core import QgsWkbTypes
+    pk_indexes  = set(layer.dataProvider().pkAttributeIndexes())
+    geom_source = layer.dataProvider().geometryColumnName() or "geom"
+
+    select_pk, selected, columns = [], [], []
+    for idx, field in enumerate(layer.fields()):
+        name = field.name()
+        col  = field_rename[name].lower() if lowercase else field_rename[name]
+        if idx in pk_indexes:
+            if pk_as_field:
+                columns.append(col)
+                select_pk.append(f"CAST({quote_ident(name)} AS INTEGER) AS {quote_ident(col)}")
+            else:
+                select_pk.append(quote_ident(name))
+            continue
+        columns.append(col)
+        selected.append(f"{quote_ident(name)} AS {quote_ident(col)}")
+    select = select_pk + selected
+    if layer.wkbType() != QgsWkbTypes.NoGeometry:
+        select.append(quote_ident(geom_source))
+    return f"SELECT {', '.join(select)} FROM {quote_ident(table)}", columns
+
+
+def copy_gpkg_layer(layer, source, dest_ds, table_name, field_rename):
+    """
+    Copia a tabela para o GPKG de saida (dataset ja aberto) com GDAL: VectorTranslate
+    + SELECT com os campos renomeados, sem passar cada feicao pelo QGIS/processing.
+    A chave primaria (fid) segue como FID; a geometria e gravada em "geom".
+    """
+    path, table = source
+    sql, _      = build_rename_select(layer, table, field_rename)
+
+    ok = gdal.VectorTranslate(
+        dest_ds, path,
+        SQLStatement=sql,
+        layerName=table_name,
+        geometryType=gdal_geometry_type(layer),
+        layerCreationOptions=['GEOMETRY_NAME=geom'],
+    )
+    if not ok:
+        raise RuntimeError(gdal.GetLastErrorMsg() or "VectorTranslate falhou")
+    dest_ds.FlushCache()
+
+
 # =============================================================================
 # --- GPKG local: layer_styles via SQLite ---
 # =============================================================================
@@ -210,30 +370,42 @@ CREATE TABLE IF NOT EXISTS layer_styles (
 );
 """
 
-def ensure_sqlite_layer_styles(gpkg_path):
-    con = sqlite3.connect(gpkg_path)
-    con.executescript(DDL_LAYER_STYLES_SQLITE)
-    con.commit()
-    con.close()
-
-
-def save_style_sqlite(gpkg_path, table_name, geom_col, qml_xml, sld_xml):
+def save_styles_sqlite(gpkg_path, styles):
+    """
+    Grava QML e SLD na layer_styles do GPKG local.
+    styles: lista de (table_name, geom_col, qml_xml, sld_xml).
+    Uma conexao e um commit para todas as camadas (DELETE/INSERT via executemany).
+    journal_mode=MEMORY vale so para esta conexao (nao fica gravado no arquivo,
+    ao contrario do WAL) e synchronous=OFF evita o fsync em pastas de rede/OneDrive.
+    """
     con = sqlite3.connect(gpkg_path)
-    cur = con.cursor()
-    cur.execute(
-        "DELETE FROM layer_styles WHERE f_table_name=? AND styleName=?",
-        (table_name, table_name)
-    )
-    cur.execute(
-        """INSERT INTO layer_styles
-           (f_table_catalog, f_table_schema, f_table_name,
-            f_geometry_column, styleName, styleQML, styleSLD,
-            useAsDefault, description, owner)
-           VALUES ('','',?,?,?,?,?,1,'','')""",
-        (table_name, geom_col, table_name, qml_xml, sld_xml)
-    )
-    con.commit()
-    con.close()
+    try:
+        con.execute("PRAGMA synchronous=OFF")
+        con.execute("PRAGMA journal_mode=MEMORY")
+        con.execute("PRAGMA temp_store=MEMORY")
+        cur = con.cursor()
+        # BEGIN explicito: o sqlite3 so abre a transacao sozinho antes de DML, e o
+        # CREATE TABLE ficaria em autocommit, fora da transacao dos DELETE/INSERT
+        cur.execute("BEGIN")
+        cur.execute(DDL_LAYER_STYLES_SQLITE)
+        cur.executemany(
+            "DELETE FROM layer_styles WHERE f_table_name=? AND styleName=?",
+            [(table_name, table_name) for table_name, *_ in styles]
+        )
+        cur.executemany(
+            """INSERT INTO layer_styles
+               (f_table_catalog, f_table_schema, f_table_name,
+                f_geometry_column, styleName, styleQML, styleSLD,
+                useAsDefault, description, owner)
+               VALUES ('','',?,?,?,?,?,1,'','')""",
+            [
+                (table_name, geom_col, table_name, qml_xml, sld_xml)
+                for table_name, geom_col, qml_xml, sld_xml in styles
+            ]
+        )
+        con.commit()
+    finally:
+        con.close()
 
 
 # =============================================================================
@@ -264,9 +436,14 @@ def get_geom_type_name(layer):
     return type_map.get(wkb_type, QgsWkbTypes.displayString(wkb_type))
 
 
-def save_style_pg(conn, db_name, schema, table_name, geom_col, geom_type, qml_xml, sld_xml):
+def save_styles_pg(conn, db_name, schema, styles):
     """
     Insere QML e SLD na tabela public.layer_styles do PostgreSQL.
+    styles: lista de (table_name, geom_col, geom_type, qml_xml, sld_xml).
+
+    DELETE e INSERT sao enviados em lote (execute_values, ate 1000 linhas por
+    comando) e confirmados em um unico commit, com synchronous_commit desligado
+    so para esta transacao.
 
     Correcoes aplicadas:
       - f_table_catalog : nome real do banco (db_name), nao string vazia
@@ -274,84 +451,502 @@ def save_style_pg(conn, db_name, schema, table_name, geom_col, geom_type, qml_xm
       - type            : tipo de geometria da camada (Point, Polygon, etc.)
     """
     from datetime import datetime
+    from psycopg2.extras import execute_values
     load_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     cur = conn.cursor()
-    cur.execute(
-        """DELETE FROM public.layer_styles
-           WHERE f_table_catalog=%s AND f_table_schema=%s
-             AND f_table_name=%s AND stylename=%s""",
-        (db_name, schema, table_name, table_name)
+    # Linhas de estilo nao sao criticas: o commit nao espera o fsync do WAL no servidor
+    cur.execute("SET LOCAL synchronous_commit = off")
+    execute_values(
+        cur,
+        """DELETE FROM public.layer_styles AS s
+           USING (VALUES %s) AS v(f_table_catalog, f_table_schema, f_table_name, stylename)
+           WHERE s.f_table_catalog=v.f_table_catalog AND s.f_table_schema=v.f_table_schema
+             AND s.f_table_name=v.f_table_name AND s.stylename=v.stylename""",
+        [(db_name, schema, table_name, table_name) for table_name, *_ in styles],
+        page_size=1000,
     )
-    cur.execute(
+    execute_values(
+        cur,
         """INSERT INTO public.layer_styles
            (f_table_catalog, f_table_schema, f_table_name,
             f_geometry_column, stylename, styleqml, stylesld,
             useasdefault, description, type)
-           VALUES (%s, %s, %s, %s, %s,
-                   %s::xml, %s::xml,
-                   true, %s, %s)""",
-        (
-            db_name,
-            schema,
-            table_name,
-            geom_col,
-            table_name,
-            qml_xml,
-            sld_xml,
-            f"Carregado em {load_time}",   # description = data/hora do upload
-            geom_type,                      # type = tipo de geometria real
-        )
+           VALUES %s""",
+        [
+            (
+                db_name,
+                schema,
+                table_name,
+                geom_col,
+                table_name,
+                qml_xml,
+                sld_xml,
+                f"Carregado em {load_time}",   # description = data/hora do upload
+                geom_type,                      # type = tipo de geometria real
+            )
+            for table_name, geom_col, geom_type, qml_xml, sld_xml in styles
+        ],
+        template="(%s, %s, %s, %s, %s, %s::xml, %s::xml, true, %s, %s)",
+        page_size=1000,
     )
     conn.commit()
     cur.close()
 
 
 # =============================================================================
-# --- EXPORTAR QML + SLD via arquivo temporario ---
+# --- PostgreSQL: carga das camadas via COPY binario ---
+# =============================================================================
+
+# Tipo PostgreSQL e codificador binario (formato do COPY ... FORMAT BINARY) por tipo de campo
+_PG_EPOCH_DATE     = date(2000, 1, 1)
+_PG_EPOCH_DATETIME = datetime(2000, 1, 1)
+
+def _encode_int4(v):   return struct.pack('>i', int(v))
+def _encode_int8(v):   return struct.pack('>q', int(v))
+def _encode_float8(v): return struct.pack('>d', float(v))
+def _encode_bool(v):   return b'\x01' if v else b'\x00'
+def _encode_text(v):   return str(v).encode('utf-8')
+
+def _encode_date(v):
+    v = v.toPyDate() if hasattr(v, 'toPyDate') else v
+    return struct.pack('>i', (v - _PG_EPOCH_DATE).days)
+
+def _encode_timestamp(v):
+    v = v.toPyDateTime() if hasattr(v, 'toPyDateTime') else v
+    delta = v.replace(tzinfo=None) - _PG_EPOCH_DATETIME
+    return struct.pack('>q', (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+def _encode_time(v):
+    v = v.toPyTime() if hasattr(v, 'toPyTime') else v
+    return struct.pack('>q', ((v.hour * 60 + v.minute) * 60 + v.second) * 1000000 + v.microsecond)
+
+PG_TYPES = {
+    QVariant.Int:       ('integer',          _encode_int4),
+    QVariant.UInt:      ('bigint',           _encode_int8),
+    QVariant.LongLong:  ('bigint',           _encode_int8),
+    QVariant.ULongLong: ('bigint',           _encode_int8),
+    QVariant.Double:    ('double precision', _encode_float8),
+    QVariant.Bool:      ('boolean',          _encode_bool),
+    QVariant.Date:      ('date',             _encode_date),
+    QVariant.DateTime:  ('timestamp',        _encode_timestamp),
+    QVariant.Time:      ('time',             _encode_time),
+}
+PG_TYPE_DEFAULT = ('text', _encode_text)
+
+
+def quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def pg_column_type(field):
+    """Tipo da coluna no PostgreSQL; texto com limite vira varchar(n) se DROP_STRING_LENGTH = False."""
+    pg_type, encode = PG_TYPES.get(field.type(), PG_TYPE_DEFAULT)
+    if pg_type == 'text' and field.type() == QVariant.String and field.length() > 0 and not DROP_STRING_LENGTH:
+        pg_type = f"varchar({field.length()})"
+    return pg_type, encode
+
+
+def to_ewkb(wkb, srid):
+    """Converte WKB em EWKB inserindo o SRID logo apos o tipo da geometria."""
+    order    = '<' if wkb[0] == 1 else '>'
+    wkb_type = struct.unpack(order + 'I', wkb[1:5])[0]
+    return wkb[:1] + struct.pack(order + 'II', wkb_type | 0x20000000, srid) + wkb[5:]
+
+
+def pg_geometry_type(wkb_type):
+    """
+    Tipo da coluna geometry no PostGIS: Unknown/NoGeometry viram Geometry e os
+    tipos 2.5D (ex.: MultiPolygon25D) usam a grafia Z (MultiPolygonZ).
+    """
+    from qgis.core import QgsWkbTypes
+    flat = QgsWkbTypes.flatType(wkb_type)
+    if flat in (QgsWkbTypes.Unknown, QgsWkbTypes.NoGeometry):
+        return 'Geometry'
+    return QgsWkbTypes.displayString(
+        QgsWkbTypes.zmType(flat, QgsWkbTypes.hasZ(wkb_type), QgsWkbTypes.hasM(wkb_type))
+    )
+
+
+class CopyStream:
+    """
+    Fluxo binario do COPY gerado sob demanda (objeto tipo arquivo lido pelo copy_expert):
+    cada tupla e montada quando o PostgreSQL pede mais dados, sem materializar a camada.
+    Le as feicoes de um QgsVectorLayerFeatureSource, criado na thread principal e seguro
+    para iterar na thread de upload.
+    Geometrias invalidas seguem INVALID_FEATURES_FILTER (0=ignorar | 1=pular | 2=parar);
+    as puladas ficam em skipped. Com FORCE_SINGLEPART, feicoes multipartes viram uma tupla por parte.
+    with_geom=False: tabela sem geometria, so os atributos.
+    """
+
+    def __init__(self, source, encoders, srid, with_geom=True):
+        self.skipped  = 0
+        self._chunks  = self._rows(source, encoders, srid, with_geom)
+        self._pending = bytearray()
+
+    def read(self, size=-1):
+        while size < 0 or len(self._pending) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._pending += chunk
+        if size < 0:
+            size = len(self._pending)
+        data = bytes(self._pending[:size])
+        del self._pending[:size]
+        return data
+
+    def _rows(self, source, encoders, srid, with_geom):
+        yield b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+        row_header = struct.pack('>h', len(encoders) + (1 if with_geom else 0))
+        null       = struct.pack('>i', -1)
+        for feature in source.getFeatures():
+            geometry = feature.geometry()
+            has_geom = geometry is not None and not geometry.isNull()
+            if has_geom and INVALID_FEATURES_FILTER and not geometry.isGeosValid():
+                if INVALID_FEATURES_FILTER == 2:
+                    raise RuntimeError(f"geometria invalida na feicao {feature.id()}")
+                self.skipped += 1
+                continue
+            row = bytearray(row_header)   # atributos codificados uma vez, repetidos por parte
+            for value, encode in zip(feature.attributes(), encoders):
+                if value is None or (isinstance(value, QVariant) and value.isNull()):
+                    row += null
+                else:
+                    data = encode(value)
+                    row += struct.pack('>i', len(data))
+                    row += data
+            if not with_geom:
+                yield bytes(row)
+                continue
+            parts = [geometry] if has_geom else []
+            if has_geom and FORCE_SINGLEPART and geometry.isMultipart():
+                # Uma linha por parte (como o -explodecollections): a coluna e do tipo simples
+                parts = geometry.asGeometryCollection()
+            if not parts:
+                yield bytes(row + null)
+                continue
+            for part in parts:
+                data = to_ewkb(bytes(part.asWkb()), srid)
+                yield b''.join((row, struct.pack('>i', len(data)), data))
+        yield struct.pack('>h', -1)
+
+
+def build_table_pg(layer, table_name, field_rename):
+    """
+    Estrutura da tabela de destino, a mesma para o COPY e para a copia pelo GDAL:
+    todos os campos renomeados (o fid do GPKG e uma coluna comum), "id serial" como
+    chave quando nao ha campo id e a geometria em PG_GEOMETRY_COLUMN.
+    Retorna (tabela, ddl, colunas, tipos, srid, with_geom).
+    """
+    from qgis.core import QgsWkbTypes
+    fields  = layer.fields()
+    columns = [field_rename[field.name()] for field in fields]
+    if LOWERCASE_NAMES:
+        columns    = [col.lower() for col in columns]
+        table_name = table_name.lower()
+    types  = [pg_column_type(field) for field in fields]
+    srid   = layer.crs().postgisSrid()
+    target = f"{quote_ident(PG_SCHEMA)}.{quote_ident(table_name)}"
+
+    wkb_type = layer.wkbType()
+    if FORCE_SINGLEPART:
+        wkb_type = QgsWkbTypes.singleType(wkb_type)
+    geom_type = pg_geometry_type(wkb_type)
+
+    with_geom  = layer.wkbType() != QgsWkbTypes.NoGeometry
+    column_ddl = [f"{quote_ident(col)} {pg_type}" for col, (pg_type, _) in zip(columns, types)]
+    if 'id' not in columns:
+        column_ddl.insert(0, "id serial PRIMARY KEY")
+    if with_geom:
+        column_ddl.append(f"{quote_ident(PG_GEOMETRY_COLUMN)} geometry({geom_type}, {srid})")
+
+    ddl = [f"CREATE TABLE {target} ({', '.join(column_ddl)})"]
+    if OVERWRITE:
+        ddl.insert(0, f"DROP TABLE IF EXISTS {target}")
+    return target, ddl, columns, types, srid, with_geom
+
+
+def prepare_import_pg(layer, table_name, field_rename):
+    """
+    Le a estrutura da camada (na thread principal, onde os objetos do QGIS podem ser usados)
+    e devolve o que o upload precisa: comandos SQL e o fluxo do COPY, que le as feicoes
+    sob demanda na thread de upload.
+    Substitui o refactorfields em memoria + native:importintopostgis, que insere linha a linha.
+    """
+    from qgis.core import QgsVectorLayerFeatureSource
+    target, ddl, columns, types, srid, with_geom = build_table_pg(layer, table_name, field_rename)
+    copy_columns = ", ".join(quote_ident(col) for col in columns + ([PG_GEOMETRY_COLUMN] if with_geom else []))
+
+    # Tabela criada na mesma transacao do COPY: com wal_level=minimal o PostgreSQL nao grava WAL da carga
+    return {
+        'kind':     'copy',
+        'target':   target,
+        'ddl':      ddl,
+        'copy_sql': f"COPY {target} ({copy_columns}) FROM STDIN WITH (FORMAT BINARY)",
+        'stream':   CopyStream(QgsVectorLayerFeatureSource(layer), [encode for _, encode in types], srid, with_geom),
+        'spatial':  with_geom,
+    }
+
+
+def pg_dsn(creds):
+    """String de conexao OGR (PG:...) com as credenciais do QGIS."""
+    def quote(value):
+        return "'" + str(value).replace('\\', '\\\\').replace("'", "\\'") + "'"
+    return "PG:" + " ".join(
+        f"{key}={quote(creds[name])}"
+        for key, name in (("host", "host"), ("port", "port"), ("dbname", "database"),
+                          ("user", "user"), ("password", "password"))
+    )
+
+
+def prepare_gdal_import_pg(layer, source, table_name, field_rename):
+    """
+    Para tabelas GPKG lidas direto do arquivo: devolve um job para o GDAL copiar
+    GPKG -> PostgreSQL (driver PG, que usa COPY) com um SELECT que ja renomeia os
+    campos, sem ler as feicoes em Python. So usado quando nao ha filtro de geometrias
+    invalidas nem FORCE_SINGLEPART, que dependem da leitura pelo QGIS.
+    A tabela e criada pelo mesmo DDL do COPY (build_table_pg) e o GDAL so acrescenta
+    as feicoes, entao os dois caminhos geram a mesma estrutura.
+    """
+    path, table = source
+    target, ddl, _, _, _, with_geom = build_table_pg(layer, table_name, field_rename)
+    sql, _ = build_rename_select(layer, table, field_rename, lowercase=LOWERCASE_NAMES, pk_as_field=True)
+    if LOWERCASE_NAMES:
+        table_name = table_name.lower()
+
+    return {
+        'kind':     'gdal',
+        'target':   target,
+        'ddl':      ddl,
+        'src':      path,
+        'spatial':  with_geom,
+        'options':  dict(
+            format='PostgreSQL',
+            accessMode='append',
+            SQLStatement=sql,
+            layerName=f"{PG_SCHEMA}.{table_name}",   # com schema: sem ele o GDAL procura no search_path
+        ),
+    }
+
+
+def upload_gdal_pg(conn, dsn, job):
+    """
+    Cria a tabela (mesmo DDL do COPY) e acrescenta as feicoes pelo GDAL (roda nas threads
+    de upload). O id serial e preenchido pelo banco: o GDAL nao reaproveita o FID da origem.
+    Se a copia falhar, a tabela vazia e removida.
+    """
+    with conn:
+        with conn.cursor() as cur:
+            for statement in job['ddl']:
+                cur.execute(statement)
+    try:
+        result = gdal.VectorTranslate(dsn, job['src'], **job['options'])
+        if result is None:
+            raise RuntimeError(gdal.GetLastErrorMsg() or "VectorTranslate falhou")
+        result = None   # fecha o dataset e finaliza o COPY
+    except Exception:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {job['target']}")
+        raise
+
+
+def upload_import_pg(conn, job):
+    """
+    Cria a tabela (sem indice espacial) e executa o COPY em uma unica transacao.
+    Indice e ANALYZE ficam para finalize_table_pg, depois de todas as cargas.
+    Retorna o numero de feicoes invalidas puladas.
+    """
+    with conn:
+        with conn.cursor() as cur:
+            for statement in job['ddl']:
+                cur.execute(statement)
+            cur.copy_expert(job['copy_sql'], job['stream'])
+    return job['stream'].skipped
+
+
+def finalize_table_pg(pool, target, spatial=True):
+    """
+    Cria o indice espacial e atualiza as estatisticas da tabela carregada.
+    Roda em paralelo entre tabelas (INDEX_WORKERS threads), cada uma com sua conexao do pool.
+    """
+    conn = pool.getconn()
+    try:
+        if CREATE_INDEX and spatial:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"CREATE INDEX ON {target} USING GIST ({quote_ident(PG_GEOMETRY_COLUMN)})")
+        # ANALYZE fora da transacao do indice, ja com a tabela definitiva
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"ANALYZE {target}")
+    finally:
+        conn.autocommit = False
+        pool.putconn(conn)
+
+
+# =============================================================================
+# --- PIPELINE: GPKG local (thread principal) -> PostGIS (thread de upload) ---
 # =============================================================================
 
+UPLOAD_QUEUE_SIZE = 4   # camadas prontas aguardando upload (so estrutura e fonte de feicoes, sem dados)
+
+
+def upload_worker(queue, results, pool, dsn):
+    """
+    Consumidor do pipeline (UPLOAD_WORKERS threads): recebe (orig_name, clean_name, job)
+    da fila e executa o COPY (etapa C) com uma conexao do pool. Termina ao receber None.
+    Do QGIS so usa a fonte de feicoes do job e nao escreve no console (nao e seguro fora
+    da thread principal): cada resultado vai para a fila results como
+    (orig_name, clean_name, tabela, erro ou None, feicoes invalidas puladas).
+    """
+    # Sem conexao a thread continua consumindo a fila: cada job volta com o erro,
+    # em vez de a thread morrer e deixar o produtor bloqueado no put.
+    conn, conn_error = None, None
+    try:
+        conn = pool.getconn()
+    except Exception as e:
+        conn_error = e
+    try:
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            orig_name, clean_name, job = item
+            try:
+                skipped = 0
+                if conn is None:
+                    raise RuntimeError(f"sem conexao com o PostgreSQL: {conn_error}")
+                if job['kind'] == 'gdal':
+                    upload_gdal_pg(conn, dsn, job)
+                else:
+                    skipped = upload_import_pg(conn, job)
+                results.put((orig_name, clean_name, job['target'], None, skipped))
+            except Exception as e:
+                results.put((orig_name, clean_name, job['target'], e, 0))
+    finally:
+        if conn is not None:
+            pool.putconn(conn)
+
+
+def put_upload(queue, uploaders, item):
+    """
+    Enfileira um job (ou o None de parada) sem bloquear para sempre:
+    se nenhuma thread de upload estiver viva, levanta RuntimeError.
+    """
+    while True:
+        if not any(uploader.is_alive() for uploader in uploaders):
+            raise RuntimeError("nenhuma thread de upload ativa")
+        try:
+            queue.put(item, timeout=1)
+            return
+        except Full:
+            continue
+
+
+def report_uploads(results, stats, pending_styles, pg_styles, loaded):
+    """
+    Reporta (na thread principal) os uploads ja concluidos pela thread de upload.
+    O estilo de cada tabela carregada passa de pending_styles para pg_styles,
+    e a tabela entra em loaded (tabela -> clean_name) para a finalizacao (indice + ANALYZE).
+    """
+    while not results.empty():
+        orig_name, clean_name, target, error, skipped = results.get()
+        if skipped:
+            log_warn(f"{skipped} feicoes com geometria invalida ignoradas em '{orig_name}'")
+        if error is None:
+            log_ok(f"✅🛢️⬆️ PostGIS: {PG_SCHEMA}.{clean_name}")
+            stats['sucesso_pg'] += 1
+            loaded[target] = clean_name
+            if clean_name in pending_styles:
+                pg_styles.append(pending_styles.pop(clean_name))
+        else:
+            log_err(f"❌🛢️⬆️ Erro ao importar '{orig_name}' para PostGIS: {error}")
+            traceback.print_exception(type(error), error, error.__traceback__)
+            stats['falha'] += 1
+            pending_styles.pop(clean_name, None)
+
+
+# =============================================================================
+# --- EXPORTAR QML + SLD em memoria ---
+# =============================================================================
+
+OGC_PROPERTY_NAME = '{http://www.opengis.net/ogc}PropertyName'
+
+
+def field_name_alternation(renamed):
+    """
+    Monta a alternancia regex com os nomes antigos (mais longos primeiro),
+    compartilhada pelas substituicoes textuais de QML e SLD.
+    """
+    return '|'.join(map(re.escape, sorted(renamed, key=len, reverse=True)))
+
+
+def rename_fields_qml(qml_xml, renamed):
+    """
+    Renomeia campos no QML: atributos field="...", <field name="...">
+    e elementos cujo texto e exatamente o nome do campo.
+    Com lxml o XML e lido uma vez e alterado no lugar; sem lxml, substituicao textual.
+    """
+    if not qml_xml or not renamed:
+        return qml_xml
+    if etree is None:
+        # As tres formas (field="x", <field name="x", >x</) numa unica passada
+        names = field_name_alternation(renamed)
+        pattern = re.compile(f'(field="|<field name=")({names})(?=")|(>)({names})(?=</)')
+        return pattern.sub(
+            lambda m: (m.group(1) + renamed[m.group(2)]) if m.group(1)
+                      else (m.group(3) + renamed[m.group(4)]),
+            qml_xml)
+
+    root = etree.fromstring(qml_xml.encode('utf-8'))
+    for el in root.iter(etree.Element):
+        if el.get('field') in renamed:
+            el.set('field', renamed[el.get('field')])
+        if el.tag == 'field' and el.get('name') in renamed:
+            el.set('name', renamed[el.get('name')])
+        if len(el) == 0 and el.text in renamed:
+            el.text = renamed[el.text]
+    return etree.tostring(root.getroottree(), encoding='unicode')
+
+
+def rename_fields_sld(sld_xml, renamed):
+    """Renomeia campos nos <ogc:PropertyName> do SLD (lxml, ou substituicao textual)."""
+    if not sld_xml or not renamed:
+        return sld_xml
+    if etree is None:
+        names = field_name_alternation(renamed)
+        pattern = re.compile(f'(?<=<ogc:PropertyName>)({names})(?=</ogc:PropertyName>)')
+        return pattern.sub(lambda m: renamed[m.group(1)], sld_xml)
+
+    root = etree.fromstring(sld_xml.encode('utf-8'))
+    for el in root.iter(OGC_PROPERTY_NAME):
+        name = (el.text or '').strip()
+        if name in renamed:
+            el.text = renamed[name]
+    return etree.tostring(root.getroottree(), encoding='unicode')
+
+
 def export_styles(layer, field_rename):
     """
-    Grava QML e SLD em arquivos temp, le o conteudo,
-    substitui nomes de campos antigos pelos novos no XML.
+    Serializa QML e SLD em memoria (QDomDocument), sem arquivos temporarios,
+    e substitui nomes de campos antigos pelos novos no XML.
     Retorna (qml_str, sld_str).
     """
-    tmp_dir  = tempfile.mkdtemp()
-    qml_path = os.path.join(tmp_dir, "style.qml")
-    sld_path = os.path.join(tmp_dir, "style.sld")
+    from qgis.PyQt.QtXml import QDomDocument
+    renamed = {fo: fc for fo, fc in field_rename.items() if fo != fc}
 
     # QML
     qml_xml = ""
-    layer.saveNamedStyle(qml_path)
-    if os.path.exists(qml_path):
-        with open(qml_path, 'r', encoding='utf-8') as f:
-            qml_xml = f.read()
-        os.remove(qml_path)
-        for f_orig, f_clean in field_rename.items():
-            if f_orig != f_clean:
-                qml_xml = qml_xml.replace(f'field="{f_orig}"',      f'field="{f_clean}"')
-                qml_xml = qml_xml.replace(f'<field name="{f_orig}"', f'<field name="{f_clean}"')
-                qml_xml = qml_xml.replace(f'>{f_orig}</',            f'>{f_clean}</')
+    qml_doc = QDomDocument()
+    if not layer.exportNamedStyle(qml_doc):       # retorna a mensagem de erro ("" = ok)
+        qml_xml = rename_fields_qml(qml_doc.toString(), renamed)
 
     # SLD
-    sld_xml = ""
-    layer.saveSldStyle(sld_path)
-    if os.path.exists(sld_path):
-        with open(sld_path, 'r', encoding='utf-8') as f:
-            sld_xml = f.read()
-        os.remove(sld_path)
-        for f_orig, f_clean in field_rename.items():
-            if f_orig != f_clean:
-                sld_xml = sld_xml.replace(
-                    f'<ogc:PropertyName>{f_orig}</ogc:PropertyName>',
-                    f'<ogc:PropertyName>{f_clean}</ogc:PropertyName>'
-                )
-
-    try:
-        os.rmdir(tmp_dir)
-    except Exception:
-        pass
+    sld_doc = QDomDocument()
+    layer.exportSldStyle(sld_doc, "")
+    sld_xml = rename_fields_sld(sld_doc.toString(), renamed)
 
     return qml_xml, sld_xml
 
@@ -434,9 +1029,9 @@ def main():
         return
     log(f"Banco: {creds['database']}  host: {creds['host']}:{creds['port']}")
 
-    # 2. Conexao psycopg2
-    pg_conn = pg_connect(creds)
-    if not pg_conn:
+    # 2. Pool de conexoes psycopg2 (uploads, finalizacao das tabelas e estilos)
+    pool = pg_pool(creds, max(UPLOAD_WORKERS, INDEX_WORKERS) + 1)
+    if not pool:
         return
 
     # 3. Coletar camadas
@@ -445,12 +1040,12 @@ def main():
     except Exception:
         log_err("Erro ao coletar camadas:")
         traceback.print_exc()
-        pg_conn.close()
+        pool.closeall()
         return
 
     if not layers:
         print("\nNenhuma camada GPKG encontrada.")
-        pg_conn.close()
+        pool.closeall()
         return
 
     # Aplicar filtro de indices se definido
@@ -492,33 +1087,44 @@ def main():
     print(f"\nProcessando {len(layers)} camadas...\n")
 
     sucesso_gpkg = 0
-    sucesso_pg   = 0
-    falha        = 0
+    stats        = {'sucesso_pg': 0, 'falha': 0}
+    out_ds         = None   # GPKG de saida aberto pelo GDAL (uma vez para todas as camadas)
+    local_styles   = []   # (table_name, geom_col, qml_xml, sld_xml) para a layer_styles do GPKG
+    pending_styles = {}   # clean_name -> linha da public.layer_styles, aguardando o upload
+    pg_styles      = []   # (table_name, geom_col, geom_type, qml_xml, sld_xml) das tabelas carregadas
+    loaded         = {}   # tabela -> clean_name, finalizadas (indice + ANALYZE) depois de todos os COPY
+    without_geom   = set()   # tabelas sem geometria (sem indice espacial)
+
+    # Etapas A/B (GPKG local, estilos) e a preparacao dos jobs ficam na thread principal
+    # (PyQGIS/processing nao sao thread-safe); o COPY (etapa C) roda em UPLOAD_WORKERS
+    # threads de upload, cada uma com sua conexao do pool, lendo as feicoes sob demanda
+    # pela fonte de feicoes (QgsVectorLayerFeatureSource) do job.
+    # Os estilos do banco sao gravados todos juntos no final, na thread principal.
+    queue     = Queue(maxsize=UPLOAD_QUEUE_SIZE)
+    results   = Queue()
+    uploaders = [
+        threading.Thread(target=upload_worker, args=(queue, results, pool, pg_dsn(creds)), daemon=True)
+        for _ in range(UPLOAD_WORKERS)
+    ]
+    # Driver PG do GDAL grava com COPY (restaurado no final)
+    previous_pg_use_copy = gdal.GetConfigOption('PG_USE_COPY')
+    gdal.SetConfigOption('PG_USE_COPY', 'YES')
+    for uploader in uploaders:
+        uploader.start()
 
     for i, l_data in enumerate(layers, 1):
         layer      = l_data['obj']
         orig_name  = l_data['name_orig']
         clean_name = l_data['name_clean']
 
-        # Mapa de renomeacao de campos
-        field_rename = build_field_rename(layer)
+        # Mapa de renomeacao de campos e field_map para refactorfields
+        field_rename, field_map = build_field_maps(layer)
 
         print(f"[{i}/{len(layers)}]  {orig_name}  ->  {clean_name}")
         for fo, fc in field_rename.items():
             if fo != fc:
                 print(f"         campo: {fo}  ->  {fc}")
 
-        # field_map para refactorfields
-        field_map = []
-        for field in layer.fields():
-            field_map.append({
-                'name':       field_rename[field.name()],
-                'type':       field.type(),
-                'length':     field.length(),
-                'precision':  field.precision(),
-                'expression': f'"{field.name()}"',
-            })
-
         # Detectar coluna de geometria
         geom_col = "geom"
         try:
@@ -528,22 +1134,31 @@ def main():
 
         # --- A: Salvar no GPKG local ---
         try:
-            output_uri = (
-                f"ogr:dbname='{final_output}' "
-                f"table=\"{clean_name}\" (geom) format=GPKG"
-            )
-            processing.run("native:refactorfields", {
-                'INPUT':          layer,
-                'FIELDS_MAPPING': field_map,
-                'OUTPUT':         output_uri,
-            })
+            source = gpkg_source_table(layer)
+            if source:
+                # GPKG -> GPKG: copia direta pelo GDAL no dataset de saida ja aberto
+                if out_ds is None:
+                    out_ds = open_output_gpkg(final_output)
+                copy_gpkg_layer(layer, source, out_ds, clean_name, field_rename)
+            else:
+                output_uri = (
+                    f"ogr:dbname='{final_output}' "
+                    f"table=\"{clean_name}\" (geom) format=GPKG"
+                )
+                if out_ds is not None:
+                    out_ds = None   # libera o arquivo para o processing gravar
+                processing.run("native:refactorfields", {
+                    'INPUT':          layer,
+                    'FIELDS_MAPPING': field_map,
+                    'OUTPUT':         output_uri,
+                })
             log_ok(f"✅📂🖥️ GPKG local: {clean_name}")
             sucesso_gpkg += 1
 
         except Exception as e:
             log_err(f"❌📂🖥️ Erro ao salvar GPKG '{orig_name}': {e}")
             traceback.print_exc()
-            falha += 1
+            stats['falha'] += 1
             print()
             continue
 
@@ -551,69 +1166,113 @@ def main():
         qml_xml, sld_xml = "", ""
         try:
             qml_xml, sld_xml = export_styles(layer, field_rename)
-            ensure_sqlite_layer_styles(final_output)
-            save_style_sqlite(final_output, clean_name, geom_col, qml_xml, sld_xml)
-            log_ok(f"✅📂🖼️ Estilos GPKG (QML+SLD): {clean_name}")
+            local_styles.append((clean_name, geom_col, qml_xml, sld_xml))   # gravados em lote apos o loop
         except Exception as e:
-            log_warn(f"❌📂🖼️ Estilos GPKG nao gravados para '{orig_name}': {e}")
+            log_warn(f"❌📂🖼️ Estilos nao exportados para '{orig_name}': {e}")
             traceback.print_exc()
 
-        # --- C: Importar para PostgreSQL ---
+        # --- C: preparar o COPY e enviar para a thread de upload ---
         try:
-            result = processing.run("native:refactorfields", {
-                'INPUT':          layer,
-                'FIELDS_MAPPING': field_map,
-                'OUTPUT':         'memory:',
-            })
-            layer_clean = result['OUTPUT']
-
-            processing.run("native:importintopostgis", {
-                'INPUT':                   layer_clean,
-                'DATABASE':                creds['database'],
-                'SCHEMA':                  PG_SCHEMA,
-                'TABLENAME':               clean_name,
-                'GEOMETRY_COLUMN':         PG_GEOMETRY_COLUMN,
-                'ENCODING':                'UTF-8',
-                'OVERWRITE':               OVERWRITE,
-                'CREATEINDEX':             CREATE_INDEX,
-                'LOWERCASE_NAMES':         LOWERCASE_NAMES,
-                'DROP_STRING_LENGTH':      DROP_STRING_LENGTH,
-                'FORCE_SINGLEPART':        FORCE_SINGLEPART,
-                'INVALID_FEATURES_FILTER': INVALID_FEATURES_FILTER,
-            })
-            log_ok(f"✅🛢️⬆️ PostGIS: {PG_SCHEMA}.{clean_name}")
-            sucesso_pg += 1
-
+            if source and not INVALID_FEATURES_FILTER and not FORCE_SINGLEPART:
+                job = prepare_gdal_import_pg(layer, source, clean_name, field_rename)
+            else:
+                job = prepare_import_pg(layer, clean_name, field_rename)
         except Exception as e:
-            log_err(f"❌🛢️⬆️ Erro ao importar '{orig_name}' para PostGIS: {e}")
+            log_err(f"❌🛢️⬆️ Erro ao ler '{orig_name}' para o PostGIS: {e}")
             traceback.print_exc()
-            falha += 1
+            stats['falha'] += 1
             print()
             continue
 
-        # --- D: Gravar estilos na public.layer_styles do PostgreSQL ---
+        if not job['spatial']:
+            without_geom.add(job['target'])
         if qml_xml or sld_xml:
-            try:
-                save_style_pg(pg_conn, creds['database'], PG_SCHEMA, clean_name, geom_col, get_geom_type_name(layer), qml_xml, sld_xml)
-                log_ok(f"✅🛢️🖼️ Estilos PostGIS (public.layer_styles): {clean_name}")
-            except Exception as e:
-                log_warn(f"❌🛢️🖼️ Estilos PostGIS nao gravados para '{orig_name}': {e}")
-                traceback.print_exc()
-                try:
-                    pg_conn.rollback()
-                except Exception:
-                    pass
+            pending_styles[clean_name] = (clean_name, geom_col, get_geom_type_name(layer), qml_xml, sld_xml)
+        try:
+            put_upload(queue, uploaders, (orig_name, clean_name, job))   # espera se a fila estiver cheia
+        except RuntimeError as e:
+            log_err(f"❌🛢️⬆️ Upload interrompido: {e}")
+            stats['falha'] += 1
+            pending_styles.pop(clean_name, None)
+            break
+        report_uploads(results, stats, pending_styles, pg_styles, loaded)
 
         print()
 
-    pg_conn.close()
+    out_ds = None   # fecha o GPKG de saida antes de gravar a layer_styles
+
+    for uploader in uploaders:
+        try:
+            put_upload(queue, uploaders, None)
+        except RuntimeError:
+            break
+    for uploader in uploaders:
+        uploader.join()
+    # Jobs que ficaram na fila sem thread para executa-los contam como falha
+    while True:
+        try:
+            item = queue.get_nowait()
+        except Empty:
+            break
+        if item is not None:
+            orig_name, clean_name, job = item
+            results.put((orig_name, clean_name, job['target'],
+                         RuntimeError("upload nao executado (threads de upload encerradas)"), 0))
+    gdal.SetConfigOption('PG_USE_COPY', previous_pg_use_copy)
+    report_uploads(results, stats, pending_styles, pg_styles, loaded)
+
+    # --- C2: Finalizar as tabelas carregadas, em paralelo entre tabelas ---
+    if loaded:
+        log(f"Finalizando {len(loaded)} tabelas (indice espacial + ANALYZE)...")
+        with ThreadPoolExecutor(max_workers=INDEX_WORKERS) as executor:
+            futures = {executor.submit(finalize_table_pg, pool, target, target not in without_geom): target
+                       for target in loaded}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    # Tabela sem indice/estatisticas: conta como falha e nao recebe estilo
+                    target = futures[future]
+                    log_err(f"❌🛢️ Falha ao finalizar {target}: {e}")
+                    stats['sucesso_pg'] -= 1
+                    stats['falha'] += 1
+                    pg_styles = [row for row in pg_styles if row[0] != loaded[target]]
+
+    # --- B: Gravar estilos na layer_styles do GPKG local (uma conexao, um commit) ---
+    if local_styles:
+        try:
+            save_styles_sqlite(final_output, local_styles)
+            log_ok(f"✅📂🖼️ Estilos GPKG (QML+SLD): {len(local_styles)} camadas")
+        except Exception as e:
+            log_warn(f"❌📂🖼️ Estilos GPKG nao gravados: {e}")
+            traceback.print_exc()
+
+    # --- D: Gravar estilos na public.layer_styles do PostgreSQL (um lote, um commit) ---
+    if pg_styles:
+        pg_conn = None
+        try:
+            pg_conn = pool.getconn()
+            save_styles_pg(pg_conn, creds['database'], PG_SCHEMA, pg_styles)
+            log_ok(f"✅🛢️🖼️ Estilos PostGIS (public.layer_styles): {len(pg_styles)} camadas")
+        except Exception as e:
+            log_warn(f"❌🛢️🖼️ Estilos PostGIS nao gravados: {e}")
+            traceback.print_exc()
+            try:
+                if pg_conn is not None:
+                    pg_conn.rollback()
+            except Exception:
+                pass
+        finally:
+            if pg_conn is not None:
+                pool.putconn(pg_conn)
+    pool.closeall()
 
     # Resumo
     print("=" * 60)
     print(f"  ✅ CONCLUIDO\n")
     print(f"  📂 GPKG local : {sucesso_gpkg} \n Caminho:  {final_output}")
-    print(f"  🛢️ PostGIS    : {sucesso_pg} \n Caminho:  {creds['database']}.{PG_SCHEMA}")
-    print(f"  ❌ Erros      : {falha}")
+    print(f"  🛢️ PostGIS    : {stats['sucesso_pg']} \n Caminho:  {creds['database']}.{PG_SCHEMA}")
+    print(f"  ❌ Erros      : {stats['falha']}")
     print("=" * 60)
 
 
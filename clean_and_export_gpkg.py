@@ -15,7 +15,9 @@
 # =============================================================================
 
 import os
+import contextlib
 import re
+import functools
 import sys
 import sqlite3
 import unicodedata
@@ -26,13 +28,18 @@ try:
         QgsApplication, QgsProject, QgsVectorLayer,
         QgsMapLayer, QgsMessageLog, Qgis
     )
-    import processing
+    from osgeo import gdal
     INSIDE_QGIS = QgsApplication.instance() is not None
 except ImportError:
     print("ERRO: Este script requer QGIS/PyQGIS no PATH.")
     print("No OSGeo4W Shell, rode primeiro: py3_env")
     sys.exit(1)
 
+try:
+    from lxml import etree                      # opcional: reescrita de estilos via XML
+except ImportError:
+    etree = None
+
 # =============================================================================
 # ---              CONFIGURAÇÕES DO USUÁRIO [ALTERAR AQUI]                  ---
 # =============================================================================
@@ -50,14 +57,34 @@ ADD_TO_PROJECT = False            # Adicionar camadas limpas ao projeto QGIS? (I
 TABLE_PREFIX   = "teste_"         # GeoServer não aceita tabelas iniciando em número
 TRUNCATE_LIMIT = 63              # Limite PostgreSQL / GeoServer
 
+# Opcoes do GDAL durante a gravacao do GPKG de saida: sem fsync a cada commit e journal
+# em memoria. Troca a seguranca contra queda de energia/travamento pela velocidade do
+# lote (o GPKG de saida e regerado a cada execucao). Restauradas apos cada gravacao (gdal_config).
+GPKG_WRITE_OPTIONS = {
+    'OGR_SQLITE_SYNCHRONOUS': 'OFF',
+    'OGR_SQLITE_JOURNAL':     'MEMORY',
+    'OGR_SQLITE_CACHE':       '1024',      # MB
+    'SQLITE_USE_OGR_VFS':     'YES',
+}
+
 # =============================================================================
 # --- SANITIZAÇÃO (apenas nome de tabela/camada) [NÃO ALTERAR A PARTIR DAQUI] ---
 # =============================================================================
 
+_NON_ALNUM = re.compile(r'[^a-zA-Z0-9]+')
+
+# Acentos comuns do portugues -> ASCII em uma unica passada (caminho rapido)
+_ASCII_FOLD = str.maketrans(
+    'áàâãäéèêëíìîïóòôõöúùûüçÁÀÂÃÄÉÈÊËÍÌÎÏÓÒÔÕÖÚÙÛÜÇñÑ',
+    'aaaaaeeeeiiiiooooouuuucAAAAAEEEEIIIIOOOOOUUUUCnN',
+)
+
+
+@functools.lru_cache(maxsize=4096)
 def sanitize_layer_name(text):
     """
     Sanitiza nome de camada:
-      1. NFD - remove diacríticos
+      1. Remove diacríticos (tabela ASCII; NFD para os demais)
       2. Não alfanumérico - separador de palavra
       3. camelCase
       4. Adiciona TABLE_PREFIX
@@ -68,9 +95,12 @@ def sanitize_layer_name(text):
     if not text or not text.strip():
         return f"{TABLE_PREFIX}semNome"
 
-    text = unicodedata.normalize('NFD', text)
-    text = "".join(c for c in text if unicodedata.category(c) != 'Mn')
-    words = re.sub(r'[^a-zA-Z0-9]+', ' ', text).split()
+    text = text.translate(_ASCII_FOLD)
+    if not text.isascii():
+        # Outros caracteres acentuados: NFD + remocao das marcas combinantes
+        text = unicodedata.normalize('NFD', text)
+        text = "".join(c for c in text if unicodedata.category(c) != 'Mn')
+    words = _NON_ALNUM.sub(' ', text).split()
 
     if not words:
         return f"{TABLE_PREFIX}semNome"
@@ -137,6 +167,7 @@ def get_layers_to_process():
                 'name_orig':   layer.name(),
                 'name_clean':  sanitize_layer_name(layer.name()),
                 'source_path': source.split('|')[0],
+                'geom_col':    layer.dataProvider().geometryColumnName() or "geom",
             }
             log(f"   [OK] {layer.name()}  ->  {entry['name_clean']}")
             layers.append(entry)
@@ -165,6 +196,7 @@ def get_layers_to_process():
                 'name_orig':   name,
                 'name_clean':  sanitize_layer_name(name),
                 'source_path': INPUT_GPKG,
+                'geom_col':    layer.dataProvider().geometryColumnName() or "geom",
             }
             log(f"   [OK] {name}  ->  {entry['name_clean']}")
             layers.append(entry)
@@ -172,6 +204,211 @@ def get_layers_to_process():
     return layers
 
 
+# =============================================================================
+# --- COPIA DIRETA GPKG -> GPKG ---
+# =============================================================================
+
+def quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def open_output_gpkg(gpkg_path):
+    """Abre (ou cria) o GPKG de saida uma vez para todas as camadas copiadas pelo GDAL."""
+    if os.path.exists(gpkg_path):
+        ds = gdal.OpenEx(gpkg_path, gdal.OF_VECTOR | gdal.OF_UPDATE)
+    else:
+        ds = gdal.GetDriverByName('GPKG').Create(gpkg_path, 0, 0, 0, gdal.GDT_Unknown)
+    if ds is None:
+        raise RuntimeError(gdal.GetLastErrorMsg() or f"nao foi possivel abrir {gpkg_path}")
+    return ds
+
+
+@contextlib.contextmanager
+def gdal_config(options):
+    """Aplica opcoes de configuracao do GDAL e restaura os valores anteriores na saida, mesmo com erro."""
+    previous = {key: gdal.GetConfigOption(key) for key in options}
+    for key, value in options.items():
+        gdal.SetConfigOption(key, value)
+    try:
+        yield
+    finally:
+        for key, value in previous.items():
+            gdal.SetConfigOption(key, value)
+
+
+def gpkg_source_table(layer):
+    """
+    Retorna (caminho, tabela) se a camada e uma tabela GPKG lida direto do arquivo
+    (sem filtro, sem edicoes pendentes e so com campos da fonte); senao None.
+    """
+    from qgis.core import QgsFields, QgsProviderRegistry
+    if layer.providerType() != 'ogr' or layer.subsetString() or layer.isModified():
+        return None
+    # Campos virtuais/de expressao ou de join nao existem na tabela: vao pelo QGIS
+    fields = layer.fields()
+    if any(fields.fieldOrigin(idx) != QgsFields.OriginProvider for idx in range(fields.count())):
+        return None
+    parts = QgsProviderRegistry.instance().decodeUri('ogr', layer.source())
+    path  = parts.get('path', '')
+    if not path.lower().endswith('.gpkg'):
+        return None
+    table = parts.get('layerName')
+    if not table:
+        # Sem layername na URI (ex.: GPKG de uma tabela so): o nome exibido no projeto
+        # nao e o nome da tabela; resolve pelo layerid (ou a primeira tabela) no GDAL
+        layer_id = parts.get('layerId')
+        ds = gdal.OpenEx(path, gdal.OF_VECTOR)
+        if ds is None:
+            return None
+        source_layer = ds.GetLayer(int(layer_id) if layer_id not in (None, '') else 0)
+        table = source_layer.GetName() if source_layer is not None else None
+        ds = None
+        if not table:
+            return None
+    return path, table
+
+
+def gdal_geometry_type(layer):
+    """Tipo de geometria para o VectorTranslate (-nlt): NONE em tabelas sem geometria."""
+    from qgis.core import QgsWkbTypes
+    if layer.wkbType() == QgsWkbTypes.NoGeometry:
+        return 'NONE'
+    geom_type = QgsWkbTypes.displayString(layer.wkbType())
+    return geom_type.upper() if geom_type and geom_type != 'Unknown' else None
+
+
+def build_rename_select(layer, table, geom_source, field_rename):
+    """
+    SELECT que le a tabela GPKG de origem ja com os campos renomeados.
+    A chave primaria (fid) vai primeiro, com o nome original, e vira o FID do destino.
+    Tabelas sem geometria nao levam a coluna de geometria.
+    """
+    from qgis.core import QgsWkbTypes
+    pk_indexes  = set(layer.dataProvider().pkAttributeIndexes())
+
+    select_pk, selected = [], []
+    for idx, field in enumerate(layer.fields()):
+        name = field.name()
+        if idx in pk_indexes:
+            select_pk.append(quote_ident(name))
+            continue
+        selected.append(f"{quote_ident(name)} AS {quote_ident(field_rename[name])}")
+    select = select_pk + selected
+    if layer.wkbType() != QgsWkbTypes.NoGeometry:
+        select.append(quote_ident(geom_source))
+    return f"SELECT {', '.join(select)} FROM {quote_ident(table)}"
+
+
+def copy_gpkg_layer(layer, source, geom_source, dest_ds, table_name, field_rename):
+    """
+    Copia a tabela para o GPKG de saida (dataset ja aberto) com GDAL: VectorTranslate
+    + SELECT com os campos renomeados, sem passar cada feicao pelo QGIS.
+    A chave primaria (fid) segue como FID; a geometria e gravada em "geom".
+    O indice espacial nao e criado aqui (ver create_spatial_indexes).
+    """
+    path, table = source
+    sql         = build_rename_select(layer, table, geom_source, field_rename)
+
+    ok = gdal.VectorTranslate(
+        dest_ds, path,
+        SQLStatement=sql,
+        layerName=table_name,
+        geometryType=gdal_geometry_type(layer),
+        layerCreationOptions=['GEOMETRY_NAME=geom', 'SPATIAL_INDEX=NO'],
+    )
+    if not ok:
+        raise RuntimeError(gdal.GetLastErrorMsg() or "VectorTranslate falhou")
+    dest_ds.FlushCache()
+
+
+def write_layer_gpkg(layer, gpkg_path, table_name):
+    """
+    Grava a camada no GPKG de saida com QgsVectorFileWriter, quando nenhum campo
+    precisa ser renomeado.
+    O indice espacial fica para create_spatial_indexes.
+    """
+    from qgis.core import QgsVectorFileWriter
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName   = 'GPKG'
+    options.layerName    = table_name
+    options.fileEncoding = 'UTF-8'
+    options.layerOptions = ['GEOMETRY_NAME=geom', 'SPATIAL_INDEX=NO']
+    options.actionOnExistingFile = (
+        QgsVectorFileWriter.CreateOrOverwriteLayer if os.path.exists(gpkg_path)
+        else QgsVectorFileWriter.CreateOrOverwriteFile
+    )
+    error, message, _, _ = QgsVectorFileWriter.writeAsVectorFormatV3(
+        layer, gpkg_path, QgsProject.instance().transformContext(), options)
+    if error != QgsVectorFileWriter.NoError:
+        raise RuntimeError(message or f"QgsVectorFileWriter falhou ({error})")
+
+
+EXPORT_BATCH_SIZE = 10000   # feicoes entregues ao exportador por chamada
+
+
+def export_layer_gpkg(layer, gpkg_path, table_name, field_info, field_rename):
+    """
+    Grava a camada no GPKG de saida com QgsVectorLayerExporter, com os campos
+    renomeados (mesmo tipo/tamanho/precisao da fonte, mesma ordem).
+    Os atributos seguem por posicao, sem avaliar uma expressao por campo;
+    as feicoes sao entregues em lotes de EXPORT_BATCH_SIZE.
+    """
+    from itertools import islice
+    from qgis.core import QgsField, QgsFields, QgsVectorLayerExporter
+
+    new_fields = QgsFields()
+    for f_orig, f_type, f_length, f_precision in field_info:
+        new_fields.append(QgsField(field_rename[f_orig], f_type, '', f_length, f_precision))
+
+    options = {
+        'driverName':   'GPKG',
+        'layerName':    table_name,
+        'update':       os.path.exists(gpkg_path),
+        'fileEncoding': 'UTF-8',
+        'layerOptions': ['GEOMETRY_NAME=geom', 'SPATIAL_INDEX=NO'],
+    }
+    exporter = QgsVectorLayerExporter(
+        gpkg_path, 'ogr', new_fields, layer.wkbType(), layer.crs(), False, options)
+    if exporter.errorCode() != Qgis.VectorExportResult.Success:
+        raise RuntimeError(exporter.errorMessage() or "QgsVectorLayerExporter falhou")
+
+    features = layer.getFeatures()
+    while True:
+        batch = list(islice(features, EXPORT_BATCH_SIZE))
+        if not batch:
+            break
+        if not exporter.addFeatures(batch):
+            raise RuntimeError(exporter.lastError() or "falha ao gravar feicoes")
+    if not exporter.flushBuffer():
+        raise RuntimeError(exporter.lastError() or "falha ao gravar feicoes")
+    del exporter   # fecha a camada de destino
+
+
+def create_spatial_indexes(dest_ds, tables):
+    """
+    Cria o indice espacial (RTree) das tabelas copiadas de uma vez, depois que todas
+    as linhas ja foram gravadas, em vez de manter o indice a cada INSERT.
+    Tabelas sem geometria sao ignoradas. Sem gdal.UseExceptions() o ExecuteSQL nao
+    levanta excecao: o erro e conferido em GetLastErrorType().
+    """
+    for table_name in tables:
+        out_layer = dest_ds.GetLayerByName(table_name)
+        geom_col  = out_layer.GetGeometryColumn() if out_layer is not None else ''
+        if not geom_col:
+            continue
+        try:
+            gdal.ErrorReset()
+            # nomes ja sanitizados (alfanumericos), seguros no literal SQL
+            res = dest_ds.ExecuteSQL(f"SELECT CreateSpatialIndex('{table_name}', '{geom_col}')")
+            if res is not None:
+                dest_ds.ReleaseResultSet(res)
+            if gdal.GetLastErrorType() >= gdal.CE_Failure:
+                raise RuntimeError(gdal.GetLastErrorMsg())
+            log_ok(f"Indice espacial: {table_name}")
+        except Exception as e:
+            log_warn(f"Indice espacial nao criado para '{table_name}': {e}")
+
+
 # =============================================================================
 # --- GRAVAR layer_styles NO GPKG VIA SQLite ---
 # =============================================================================
@@ -195,38 +432,120 @@ CREATE TABLE IF NOT EXISTS layer_styles (
 """
 
 
-def ensure_layer_styles_table(gpkg_path):
-    """Cria a tabela layer_styles se nao existir."""
+def save_styles_to_gpkg(gpkg_path, styles):
+    """
+    Grava QML e SLD na tabela layer_styles do GPKG (cria a tabela se nao existir).
+    styles: lista de (table_name, geom_col, qml_xml, sld_xml).
+    Uma conexao e um commit para todas as camadas; remove a entrada anterior
+    de cada tabela antes de inserir.
+    """
     con = sqlite3.connect(gpkg_path)
-    con.executescript(DDL_LAYER_STYLES)
-    con.commit()
-    con.close()
+    try:
+        cur = con.cursor()
+        # BEGIN explicito: o sqlite3 so abre a transacao sozinho antes de DML, e o
+        # CREATE TABLE ficaria em autocommit, fora da transacao dos DELETE/INSERT
+        cur.execute("BEGIN")
+        cur.execute(DDL_LAYER_STYLES)
+        cur.executemany(
+            "DELETE FROM layer_styles WHERE f_table_name = ? AND styleName = ?",
+            [(table_name, table_name) for table_name, *_ in styles]
+        )
+        cur.executemany(
+            """INSERT INTO layer_styles
+               (f_table_catalog, f_table_schema, f_table_name,
+                f_geometry_column, styleName, styleQML, styleSLD,
+                useAsDefault, description, owner)
+               VALUES ('', '', ?, ?, ?, ?, ?, 1, '', '')""",
+            [
+                (table_name, geom_col, table_name, qml_xml, sld_xml)
+                for table_name, geom_col, qml_xml, sld_xml in styles
+            ]
+        )
+        con.commit()
+    finally:
+        con.close()
+
+
+# =============================================================================
+# --- RENOMEAR CAMPOS NOS ESTILOS ---
+# =============================================================================
+
+OGC_PROPERTY_NAME = '{http://www.opengis.net/ogc}PropertyName'
 
 
-def save_style_to_gpkg(gpkg_path, table_name, geom_col, qml_xml, sld_xml):
+def field_name_alternation(renamed):
     """
-    Insere QML e SLD na tabela layer_styles do GPKG.
-    Remove entrada anterior da mesma tabela antes de inserir.
+    Monta a alternancia regex com os nomes antigos (mais longos primeiro),
+    compartilhada pelas substituicoes de QML e SLD.
     """
-    con = sqlite3.connect(gpkg_path)
-    cur = con.cursor()
+    return '|'.join(map(re.escape, sorted(renamed, key=len, reverse=True)))
 
-    cur.execute(
-        "DELETE FROM layer_styles WHERE f_table_name = ? AND styleName = ?",
-        (table_name, table_name)
-    )
 
-    cur.execute(
-        """INSERT INTO layer_styles
-           (f_table_catalog, f_table_schema, f_table_name,
-            f_geometry_column, styleName, styleQML, styleSLD,
-            useAsDefault, description, owner)
-           VALUES ('', '', ?, ?, ?, ?, ?, 1, '', '')""",
-        (table_name, geom_col, table_name, qml_xml, sld_xml)
-    )
+def rename_fields_qml(qml_xml, renamed):
+    """
+    Renomeia campos no QML: atributos field="...", <field name="...">
+    e elementos cujo texto e exatamente o nome do campo.
+    Com lxml o XML e lido uma vez e alterado no lugar; sem lxml, substituicao textual.
+    """
+    if not qml_xml or not renamed:
+        return qml_xml
+    if etree is None:
+        # As tres formas (field="x", <field name="x", >x</) numa unica passada
+        names = field_name_alternation(renamed)
+        pattern = re.compile(f'(field="|<field name=")({names})(?=")|(>)({names})(?=</)')
+        return pattern.sub(
+            lambda m: (m.group(1) + renamed[m.group(2)]) if m.group(1)
+                      else (m.group(3) + renamed[m.group(4)]),
+            qml_xml)
+
+    root = etree.fromstring(qml_xml.encode('utf-8'))
+    for el in root.iter(etree.Element):
+        if el.get('field') in renamed:
+            el.set('field', renamed[el.get('field')])
+        if el.tag == 'field' and el.get('name') in renamed:
+            el.set('name', renamed[el.get('name')])
+        if len(el) == 0 and el.text in renamed:
+            el.text = renamed[el.text]
+    return etree.tostring(root.getroottree(), encoding='unicode')
+
+
+def rename_fields_sld(sld_xml, renamed):
+    """Renomeia campos nos <ogc:PropertyName> do SLD (lxml, ou substituicao textual)."""
+    if not sld_xml or not renamed:
+        return sld_xml
+    if etree is None:
+        names = field_name_alternation(renamed)
+        pattern = re.compile(f'(?<=<ogc:PropertyName>)({names})(?=</ogc:PropertyName>)')
+        return pattern.sub(lambda m: renamed[m.group(1)], sld_xml)
+
+    root = etree.fromstring(sld_xml.encode('utf-8'))
+    for el in root.iter(OGC_PROPERTY_NAME):
+        name = (el.text or '').strip()
+        if name in renamed:
+            el.text = renamed[name]
+    return etree.tostring(root.getroottree(), encoding='unicode')
+
+
+def export_styles(layer, renamed):
+    """
+    Serializa QML e SLD em memoria (QDomDocument), sem arquivos temporarios,
+    e substitui nomes de campos antigos pelos novos no XML.
+    Retorna (qml_str, sld_str); "" quando o estilo nao foi gerado.
+    """
+    from qgis.PyQt.QtXml import QDomDocument
 
-    con.commit()
-    con.close()
+    # QML
+    qml_xml = ""
+    qml_doc = QDomDocument()
+    if not layer.exportNamedStyle(qml_doc):       # retorna a mensagem de erro ("" = ok)
+        qml_xml = rename_fields_qml(qml_doc.toString(), renamed)
+
+    # SLD
+    sld_doc = QDomDocument()
+    layer.exportSldStyle(sld_doc, "")
+    sld_xml = rename_fields_sld(sld_doc.toString(), renamed)
+
+    return qml_xml, sld_xml
 
 
 # =============================================================================
@@ -272,64 +591,74 @@ def main():
     if out_dir and not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
-    if os.path.exists(final_output):
-        try:
-            os.remove(final_output)
-            log("Arquivo anterior removido.")
-        except Exception as e:
-            log_warn(f"Nao foi possivel remover arquivo existente: {e}")
+    try:
+        os.remove(final_output)
+        log("Arquivo anterior removido.")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log_warn(f"Nao foi possivel remover arquivo existente: {e}")
 
     print(f"\nProcessando {len(layers)} camadas...\n")
 
     sucesso = 0
     falha   = 0
-
-    import tempfile
+    out_ds  = None   # GPKG de saida aberto pelo GDAL (uma vez para todas as camadas)
+    pending_index = []   # tabelas copiadas sem indice espacial
+    styles  = []   # (table_name, geom_col, qml_xml, sld_xml) para a layer_styles
 
     for i, l_data in enumerate(layers, 1):
         layer      = l_data['obj']
         orig_name  = l_data['name_orig']
         clean_name = l_data['name_clean']
+        geom_col   = l_data['geom_col']    # coluna de geometria da fonte
+
+        # (nome, tipo, tamanho, precisao) lidos uma unica vez por campo
+        field_info = [(f.name(), f.type(), f.length(), f.precision())
+                      for f in layer.fields().toList()]
 
         field_rename = {}   # {nome_original: nome_limpo}
-        seen = {}
-        for field in layer.fields():
-            f_orig  = field.name()
+        seen = set()
+        next_suffix = {}    # proximo sufixo a testar por base, evita refazer a sondagem
+        for f_orig, _, _, _ in field_info:
             f_clean = sanitize_layer_name(f_orig).replace(TABLE_PREFIX, "", 1)  # sem prefixo em campos
-            base = f_clean
-            count = 1
-            while f_clean in seen.values():
-                f_clean = f"{base}_{count}"
-                count += 1
+            if f_clean in seen:
+                base  = f_clean
+                count = next_suffix.get(base, 1)
+                while f_clean in seen:
+                    f_clean = f"{base}_{count}"
+                    count += 1
+                next_suffix[base] = count
+            seen.add(f_clean)
             field_rename[f_orig] = f_clean
-            seen[f_orig] = f_clean
+
+        renamed = {fo: fc for fo, fc in field_rename.items() if fo != fc}
 
         print(f"[{i}/{len(layers)}]  {orig_name}  ->  {clean_name}")
-        for fo, fc in field_rename.items():
-            if fo != fc:
-                print(f"         campo: {fo}  ->  {fc}")
+        for fo, fc in renamed.items():
+            print(f"         campo: {fo}  ->  {fc}")
 
         try:
-            output_uri = (
-                f"ogr:dbname='{final_output}' "
-                f"table=\"{clean_name}\" (geom) format=GPKG"
-            )
-
-            field_map = []
-            for field in layer.fields():
-                field_map.append({
-                    'name':       field_rename[field.name()],
-                    'type':       field.type(),
-                    'length':     field.length(),
-                    'precision':  field.precision(),
-                    'expression': f'"{field.name()}"',
-                })
-
-            processing.run("native:refactorfields", {
-                'INPUT':          layer,
-                'FIELDS_MAPPING': field_map,
-                'OUTPUT':         output_uri,
-            })
+            source = gpkg_source_table(layer)
+            with gdal_config(GPKG_WRITE_OPTIONS):
+                if source:
+                    # GPKG -> GPKG: copia direta pelo GDAL no dataset de saida ja aberto
+                    if out_ds is None:
+                        out_ds = open_output_gpkg(final_output)
+                    copy_gpkg_layer(layer, source, geom_col, out_ds, clean_name, field_rename)
+                    pending_index.append(clean_name)
+                elif not renamed:
+                    # Nenhum campo muda: grava a camada como esta
+                    if out_ds is not None:
+                        out_ds = None   # libera o arquivo para o QgsVectorFileWriter
+                    write_layer_gpkg(layer, final_output, clean_name)
+                    pending_index.append(clean_name)
+                else:
+                    # Campos renomeados: QgsVectorLayerExporter direto, sem processing
+                    if out_ds is not None:
+                        out_ds = None   # libera o arquivo para o exportador do QGIS
+                    export_layer_gpkg(layer, final_output, clean_name, field_info, field_rename)
+                    pending_index.append(clean_name)
 
             log_ok(f"Exportada: {clean_name}")
             sucesso += 1
@@ -342,85 +671,64 @@ def main():
             continue
 
         try:
-            ensure_layer_styles_table(final_output)
-
-            tmp_dir  = tempfile.mkdtemp()
-            qml_path = os.path.join(tmp_dir, "style.qml")
-            sld_path = os.path.join(tmp_dir, "style.sld")
-
-            # --- QML ---
-            qml_xml = ""
-            layer.saveNamedStyle(qml_path)
-            if os.path.exists(qml_path):
-                with open(qml_path, 'r', encoding='utf-8') as f:
-                    qml_xml = f.read()
-                os.remove(qml_path)
-                for f_orig, f_clean in field_rename.items():
-                    if f_orig != f_clean:
-                        qml_xml = qml_xml.replace(
-                            f'field="{f_orig}"', f'field="{f_clean}"')
-                        qml_xml = qml_xml.replace(
-                            f'<field name="{f_orig}"', f'<field name="{f_clean}"')
-                        qml_xml = qml_xml.replace(
-                            f'>{f_orig}</', f'>{f_clean}</')
+            qml_xml, sld_xml = export_styles(layer, renamed)
+            if qml_xml:
                 log_ok(f"✅🖼️ QML exportado e atualizado: {clean_name}")
             else:
                 log_warn(f"❌🖼️ QML nao gerado para '{orig_name}'")
-
-            # --- SLD ---
-            sld_xml = ""
-            layer.saveSldStyle(sld_path)
-            if os.path.exists(sld_path):
-                with open(sld_path, 'r', encoding='utf-8') as f:
-                    sld_xml = f.read()
-                os.remove(sld_path)
-                for f_orig, f_clean in field_rename.items():
-                    if f_orig != f_clean:
-                        sld_xml = sld_xml.replace(
-                            f'<ogc:PropertyName>{f_orig}</ogc:PropertyName>',
-                            f'<ogc:PropertyName>{f_clean}</ogc:PropertyName>')
+            if sld_xml:
                 log_ok(f"✅🖼️ SLD exportado e atualizado: {clean_name}")
             else:
                 log_warn(f"❌🖼️ SLD nao gerado para '{orig_name}'")
 
-            try:
-                os.rmdir(tmp_dir)
-            except Exception:
-                pass
-
-            # Detectar coluna de geometria
-            geom_col = "geom"
-            try:
-                geom_col = layer.dataProvider().geometryColumnName() or "geom"
-            except Exception:
-                pass
-
-            save_style_to_gpkg(final_output, clean_name, geom_col, qml_xml, sld_xml)
-            log_ok(f"✅ layer_styles atualizado: {clean_name}")
+            styles.append((clean_name, geom_col, qml_xml, sld_xml))   # gravados em lote apos o loop
 
         except Exception as e:
-            log_warn(f"❌ Nao foi possivel gravar estilos de '{orig_name}': {e}")
+            log_warn(f"❌ Nao foi possivel exportar estilos de '{orig_name}': {e}")
             traceback.print_exc()
 
         print()
 
+    if pending_index:
+        print("Criando indices espaciais...")
+        try:
+            with gdal_config(GPKG_WRITE_OPTIONS):
+                if out_ds is None:
+                    out_ds = open_output_gpkg(final_output)
+                create_spatial_indexes(out_ds, pending_index)
+        except Exception as e:
+            log_warn(f"Nao foi possivel criar os indices espaciais: {e}")
+            traceback.print_exc()
+    out_ds = None   # fecha o GPKG de saida aberto pelo GDAL
+
+    # Estilos na layer_styles do GPKG (uma conexao, um commit)
+    if styles:
+        try:
+            save_styles_to_gpkg(final_output, styles)
+            log_ok(f"✅ layer_styles atualizado: {len(styles)} camadas")
+        except Exception as e:
+            log_warn(f"❌ Nao foi possivel gravar estilos no GPKG: {e}")
+            traceback.print_exc()
 
     if ADD_TO_PROJECT and INSIDE_QGIS and os.path.exists(final_output):
         print("Adicionando camadas limpas ao projeto QGIS...")
-        gpkg_final = QgsVectorLayer(final_output, "temp", "ogr")
-        if not gpkg_final.isValid():
+        # Nomes das tabelas direto pelo GDAL, sem um QgsVectorLayer so para listar
+        ds = gdal.OpenEx(final_output, gdal.OF_VECTOR)
+        if ds is None:
             log_warn("Nao foi possivel abrir o GPKG de saida.")
         else:
-            for sub in gpkg_final.dataProvider().subLayers():
-                name = parse_sublayer_name(sub)
-                if not name:
-                    continue
+            names = [ds.GetLayerByIndex(idx).GetName() for idx in range(ds.GetLayerCount())]
+            ds = None
+
+            vlayers = []
+            for name in names:
                 vlayer = QgsVectorLayer(f"{final_output}|layername={name}", name, "ogr")
                 if vlayer.isValid():
-                    QgsProject.instance().addMapLayer(vlayer)
+                    vlayers.append(vlayer)
                     log_ok(f"Adicionada ao projeto: {name}")
                 else:
                     log_warn(f"Camada invalida ao adicionar: {name}")
+            QgsProject.instance().addMapLayers(vlayers)
 
     print("\n" + "=" * 60)
     print(f" ✅ TAREFA CONCLUIDA\n")
@@ -438,9 +746,5 @@ if INSIDE_QGIS:
 else:
     qgs = QgsApplication([], False)
     qgs.initQgis()
-    from qgis.analysis import QgsNativeAlgorithms
-    from processing.core.Processing import Processing
-    Processing.initialize()
-    QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
     main()
     qgs.exitQgis()
\ No newline at end of file
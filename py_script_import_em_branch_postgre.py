@@ -66,7 +66,7 @@ else:
     # 2. Loop para importar cada camada
     for i, layer_name in enumerate(layers_to_import, start=1):
         # Limpeza do nome para uso em tabelas de banco de dados
-        clean_layer_name = layer.name().replace(' ', '_').replace('-', '_').replace('´', '_').replace('Á', 'A').replace('(', '').replace(')', '').replace('.', '').replace('ç', 'c').replace('ã', 'a').replace("'", '').replace(",", '').replace("á", 'a').replace("ó", 'o').replace("õ", 'o').replace("í", 'i').replace(";", '').replace("ú", 'u').replace("é", 'e').replace("Ú", 'U').lower()
+        clean_layer_name = layer_name.replace(' ', '_').replace('-', '_').replace('´', '_').replace('Á', 'A').replace('(', '').replace(')', '').replace('.', '').replace('ç', 'c').replace('ã', 'a').replace("'", '').replace(",", '').replace("á", 'a').replace("ó", 'o').replace("õ", 'o').replace("í", 'i').replace(";", '').replace("ú", 'u').replace("é", 'e').replace("Ú", 'U').lower()
         base_tablename = f"{table_prefix}_{str(i).zfill(2)}_{clean_layer_name}"
         tablename = base_tablename[:63]
 